@@ -1,2 +1,3 @@
+from .index import ResultIndex
 from .plots import make_plots
 from .scores import ScoreComparison
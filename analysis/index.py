@@ -0,0 +1,175 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from utils import RESULTS_PATH
+from utils.results import PARTITIONS, Filters, find_result_files, read_result_file
+
+# Jury model of the rows, results written before the `JuryModel` column existed are grouped under an empty name.
+JURY = "jury"
+FILE_COLUMNS = ["path", "mtime_ns", "size", "rows"]
+POSITION_COLUMNS = ["path", *PARTITIONS, JURY, "Position", "count", "sum", "sumsq", "min", "max", "iterations"]
+PAIR_COLUMNS = ["path", *PARTITIONS, JURY, "Position", "Answer", "Score", "count", "iterations"]
+# Items below one date were queried by the same `Pipeline`, whose `Iteration` numbers are comparable
+SERIES_COLUMNS = ["judge", JURY, "dataset", "date", "qtype"]
+
+
+def jury_models(df: pd.DataFrame) -> pd.Series:
+    """The `JuryModel` column of `df` as plain strings, empty for rows without one."""
+    return df["JuryModel"].astype(object).fillna("").astype(str)
+
+
+def balanced_counts(pairs: pd.DataFrame) -> pd.Series:
+    """Weights up the (Answer, Score) counts of the items in `pairs` that were stopped early.
+
+    With early stopping (see `pipeline.EarlyStopping`) the items whose verdicts converged are left out of the later runs, plain
+    row counts would therefore over-represent the unstable items. An item counts as stopped early if its last `Iteration` is
+    below the last one of its series, the (judge, jury, dataset, date, qtype) it was queried in, and is scaled up to the latter.
+    All other counts stay as they are, including those of results written before the `Iteration` column existed.
+    """
+    series = pairs.groupby(SERIES_COLUMNS, dropna=False)["iterations"].transform("max")
+    item = pairs.groupby([*SERIES_COLUMNS, "Position"], dropna=False)["iterations"].transform("max")
+    stopped = item.notna() & (item < series)
+    if not stopped.any():
+        return pairs["count"]
+    return pairs["count"] * (series / item).where(stopped, 1.0)
+
+
+class ResultIndex:
+    """Manifest of the result files with partial aggregates per file, stored in `<root>/.index`.
+
+    `update` only reads files that were added or changed since the last call, all statistics are then combined from the
+    stored partial aggregates:
+        - per (jury, qtype, Position): count / sum / sumsq / min / max of the numerical `Score` and the last `Iteration`
+        - per (jury, Position, Answer, Score): amount of rows and the last `Iteration`, used for the textual vs. numerical comparison
+          of `ScoreComparison`
+
+    Items stopped early were scored fewer times than the others: `position_stats` returns the amount of scores (`count`) and
+    the last `Iteration` of every single item, and `pair_counts(balanced=True)` weights them up (see `balanced_counts`).
+
+    Several juries can be written below the same judge and date (see `Pipeline` sweeps), hence the statistics are kept
+    apart per `JuryModel` and the index can be filtered by "jury" in addition to the `PARTITIONS`.
+    """
+
+    def __init__(self, root: Optional[Path | str] = None):
+        self.root = Path(root) if root else RESULTS_PATH
+        self.index_dir = self.root / ".index"
+
+        self.files = self._read("files", FILE_COLUMNS)
+        self.positions = self._read("positions", POSITION_COLUMNS)
+        self.pairs = self._read("pairs", PAIR_COLUMNS)
+        if list(self.positions.columns) != POSITION_COLUMNS or list(self.pairs.columns) != PAIR_COLUMNS:
+            # Written by an older version, every file is read again by the next `update`.
+            self.files = pd.DataFrame(columns=FILE_COLUMNS)
+            self.positions = pd.DataFrame(columns=POSITION_COLUMNS)
+            self.pairs = pd.DataFrame(columns=PAIR_COLUMNS)
+
+    def _read(self, name: str, columns: List[str]) -> pd.DataFrame:
+        path = self.index_dir / f"{name}.parquet"
+        if not path.exists():
+            return pd.DataFrame(columns=columns)
+        return pd.read_parquet(path)
+
+    def _write(self, name: str, df: pd.DataFrame) -> None:
+        # Write and rename, so an interrupted update never leaves a truncated manifest behind.
+        path = self.index_dir / f"{name}.parquet"
+        tmp_path = path.with_suffix(".parquet.tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def update(self) -> int:
+        """Brings the index up to date with the result files and returns the amount of (re-)read files."""
+        current: Dict[str, tuple] = {}
+        for path, partitions in find_result_files(self.root):
+            stat = path.stat()
+            current[path.relative_to(self.root).as_posix()] = (stat.st_mtime_ns, stat.st_size, path, partitions)
+
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in zip(self.files["path"], self.files["mtime_ns"], self.files["size"])}
+        changed = [path for path, (mtime_ns, size, _, _) in current.items() if known.get(path) != (mtime_ns, size)]
+        outdated = {path for path in known if path not in current} | set(changed)
+
+        if not changed and not outdated:
+            return 0
+
+        file_rows, position_frames, pair_frames = [], [], []
+        for relative_path in changed:
+            mtime_ns, size, path, partitions = current[relative_path]
+            df = read_result_file(path, columns=["Position", "Answer", "Score", "JuryModel", "Iteration"])
+            file_rows.append({"path": relative_path, "mtime_ns": mtime_ns, "size": size, "rows": len(df)})
+
+            scores = df["Score"].astype(float)
+            juries = jury_models(df).rename(JURY)
+            keys = [juries, df["Position"]]
+            positions = scores.groupby(keys).agg(["count", "sum", "min", "max"])
+            positions["sumsq"] = (scores**2).groupby(keys).sum()
+            # Null for results written before the `Iteration` column existed
+            iterations = pd.to_numeric(df["Iteration"], errors="coerce")
+            positions["iterations"] = iterations.groupby(keys).max()
+            positions = positions.reset_index().assign(path=relative_path, **partitions)
+            position_frames.append(positions[POSITION_COLUMNS])
+
+            answers = df["Answer"].astype(object).str.replace('"', "", regex=False)
+            pairs = pd.DataFrame({JURY: juries, "Position": df["Position"], "Answer": answers, "Score": scores})
+            pairs = pairs.value_counts(dropna=False).rename("count").reset_index()
+            item_iterations = iterations.groupby(keys).max().rename("iterations")
+            pairs = pairs.join(item_iterations, on=[JURY, "Position"])
+            pairs = pairs.assign(path=relative_path, **partitions)
+            pair_frames.append(pairs[PAIR_COLUMNS])
+
+        self.files = self._merge(self.files, pd.DataFrame(file_rows, columns=FILE_COLUMNS), outdated)
+        self.positions = self._merge(self.positions, position_frames, outdated)
+        self.pairs = self._merge(self.pairs, pair_frames, outdated)
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._write("files", self.files)
+        self._write("positions", self.positions)
+        self._write("pairs", self.pairs)
+
+        return len(changed)
+
+    @staticmethod
+    def _merge(existing: pd.DataFrame, added: pd.DataFrame | List[pd.DataFrame], outdated: set) -> pd.DataFrame:
+        frames = [existing[~existing["path"].isin(outdated)]]
+        frames.extend(added if isinstance(added, list) else [added])
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return existing.iloc[0:0]
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def _filter(df: pd.DataFrame, filters: Optional[Filters]) -> pd.DataFrame:
+        for name, allowed in (filters or {}).items():
+            df = df[df[name] == allowed] if isinstance(allowed, str) else df[df[name].isin(list(allowed))]
+        return df
+
+    def position_stats(self, filters: Optional[Filters] = None) -> pd.DataFrame:
+        """Returns count / mean / min / max / std of the `Score` and the last `Iteration` per (jury, qtype, Position), combined from
+        the partial aggregates."""
+        positions = self._filter(self.positions, filters)
+        stats = positions.groupby([JURY, "qtype", "Position"]).agg(
+            count=("count", "sum"),
+            sum=("sum", "sum"),
+            sumsq=("sumsq", "sum"),
+            min=("min", "min"),
+            max=("max", "max"),
+            iterations=("iterations", "max"),
+        )
+
+        stats["mean"] = stats["sum"] / stats["count"]
+        variance = (stats["sumsq"] / stats["count"] - stats["mean"] ** 2).clip(lower=0)
+        stats["std"] = variance**0.5
+
+        return stats[["count", "mean", "min", "max", "std", "iterations"]]
+
+    def pair_counts(self, filters: Optional[Filters] = None, balanced: bool = False) -> pd.DataFrame:
+        """Returns the amount of rows per (Answer, Score) combination, missing values are kept as their own group.
+
+        With `balanced` the rows of items that were stopped early are weighted up, see `balanced_counts`. The counts are only
+        fractional if any item was stopped early.
+        """
+        pairs = self._filter(self.pairs, filters)
+        if balanced and not pairs.empty:
+            pairs = pairs.assign(count=balanced_counts(pairs))
+        return pairs.groupby(["Answer", "Score"], dropna=False)["count"].sum().reset_index()
@@ -1,106 +1,145 @@
 import seaborn as sns
 import pandas as pd
 import numpy as np
-from utils import BASE_PATH
-from typing import Set, List, Dict
+from utils import BASE_PATH, load_results
+from .index import JURY, ResultIndex, jury_models
+from typing import Callable, Set, List, Dict, Optional
 from pathlib import Path
 from itertools import product
+from concurrent.futures import ProcessPoolExecutor
 
 
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.lines import Line2D
 
+# Above this amount of points the markers of an SVG are embedded as a single bitmap instead of one path element each
+RASTERIZE_ABOVE = 2000
+
 
 def contains_filetype(path: Path, filetype: str) -> Set[Path]:
     return {csv_file.parent for csv_file in path.rglob(f"*.{filetype}")}
 
 
-def make_plots() -> List[pd.DataFrame]:
-    data_path = BASE_PATH / "data" / "results"
-    csv_dirs = contains_filetype(data_path, "csv")
-
-    subdir_frames = []
-    for csv_dir in csv_dirs:
-        dataframes = []
-
-        csv_files = [f for f in csv_dir.glob("*.csv")]
-        for csv_file in csv_files:
-
-            qtype = csv_file.stem
-            run_nr = csv_file.parent
-
-            df = pd.read_csv(csv_file, index_col="Position", usecols=["Position", "Answer", "Score"])
-            df["qtype"] = qtype
-            df["Answer"] = df["Answer"].str.replace('"', "", regex=False)
-            df["run_nr"] = run_nr.stem
-
-            dataframes.append(df)
-
-        if dataframes:
-            subdir_frames.append(pd.concat(dataframes))
-
-    return scatter_plot(subdir_frames)
-
-
-def _create_bar_plot(df: pd.DataFrame, qtype: str):
+def _render(render: Callable[..., Path], jobs: List[tuple], workers: Optional[int] = None) -> List[Path]:
+    # Every qtype is an independent figure, hence they are rendered in separate processes.
+    if workers == 1 or len(jobs) <= 1:
+        return [render(*job) for job in jobs]
 
-    df_plot = df.reset_index()
-
-    plt.figure(figsize=(14, 8))
-    plt.style.use("seaborn-v0_8-whitegrid")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render, *zip(*jobs)))
 
-    x_pos = np.arange(len(df_plot))
-    width = 0.7
 
-    colors = {"max": "#FF6B6B", "mean": "#3FB913", "min": "#2A90D0"}
+def _jury_path(img_path: Path, jury: str, juries: int) -> Path:
+    # Only results of several juries need a directory per jury, the figures of a single one keep their usual place.
+    return img_path / jury if juries > 1 and jury else img_path
 
-    # Create overlapping bars with gradient effect
-    bars_max = plt.bar(x_pos, df_plot["max"], width=width, alpha=0.4, label="Max", color=colors["max"], edgecolor="white", linewidth=1.5)
 
-    bars_mean = plt.bar(
-        x_pos, df_plot["mean"], width=width, alpha=0.8, label="Mean", color=colors["mean"], edgecolor="white", linewidth=1.5
+def make_plots(
+    fmt: str = "svg", workers: Optional[int] = None, results_path: Optional[Path] = None, img_path: Optional[Path] = None
+) -> List[pd.DataFrame]:
+    data_path = results_path or BASE_PATH / "data" / "results"
+    df = load_results(
+        data_path, columns=["Position", "Answer", "Score", "JuryModel"], partitions=["judge", "dataset", "date", "qtype", "run"]
     )
 
-    bars_min = plt.bar(x_pos, df_plot["min"], width=width, alpha=0.9, label="Min", color=colors["min"], edgecolor="white", linewidth=1.5)
-
-    # Add value labels on top of bars
-    for i, (pos, mean_val, max_val, min_val) in enumerate(zip(x_pos, df_plot["mean"], df_plot["max"], df_plot["min"])):
+    df = df.rename(columns={"run": "run_nr"}).set_index("Position")
+    df["qtype"] = df["qtype"].astype(str)
+    df[JURY] = jury_models(df)
+    df["Answer"] = df["Answer"].astype(object).str.replace('"', "", regex=False)
 
-        plt.text(pos, max_val, f"{max_val:.1f}", ha="center", va="bottom", fontweight="bold", fontsize=9, color=colors["max"])
-        plt.text(pos, mean_val - 0.1, f"{mean_val:.1f}", ha="center", va="center", fontweight="bold", fontsize=9, color="black")
-        plt.text(pos, min_val - 0.1, f"{min_val:.1f}", ha="center", va="center", fontweight="bold", fontsize=9, color="white")
+    # The juries of a sweep share the run numbers below a judge and date, every jury's runs are numbered as its own iterations.
+    run_numbers = pd.to_numeric(df["run_nr"].astype(str).str.rsplit("_", n=1).str[-1], errors="coerce")
+    series = [df[name].astype(str).to_numpy() for name in ("judge", "dataset", "date")] + [df[JURY].to_numpy()]
+    iterations = run_numbers.groupby(series).rank(method="dense")
+    df["run_nr"] = ("run_" + iterations.astype("Int64").astype(str)).to_numpy()
 
-    plt.xticks(x_pos, df_plot["Position"], rotation=45, ha="right", fontsize=11)
-    plt.xlabel(f"Question IDs for qtype: '{qtype}'", fontsize=14, fontweight="bold")
-    plt.ylabel("Aggregated Score", fontsize=14, fontweight="bold")
-    plt.title("Model Scoring Consistency", fontsize=16, fontweight="bold", pad=20)
+    return scatter_plot([df], img_path=(img_path or BASE_PATH / "data" / "img") / "scatterplot", fmt=fmt, workers=workers)
 
-    plt.legend(loc="lower right", frameon=True, fancybox=True, shadow=True, fontsize=12, title="Score Statistics", title_fontsize=13)
-    plt.grid(True, alpha=0.3, linestyle="--")
-    plt.tight_layout()
-    plt.subplots_adjust(bottom=0.15)
-    plt.gca().set_facecolor("white")
 
-    # plt.show()
-    img_path = BASE_PATH / "data" / "img"
-    img_path.mkdir(exist_ok=True, parents=True)
-    plt.savefig(f"{img_path}/{qtype}.svg", format="svg")
+def _create_bar_plot(df: pd.DataFrame, qtype: str, img_path: Path = BASE_PATH / "data" / "img", fmt: str = "svg") -> Path:
 
+    df_plot = df.reset_index()
 
-def count(df: pd.DataFrame) -> pd.DataFrame:
-    qytpes = df["qtype"].unique()
-
-    for qtype in qytpes:
-        qtype_df = df[df["qtype"] == qtype]
-        group_result = qtype_df["Score"].groupby(["Position"]).agg(["mean", "min", "max"])
-        _create_bar_plot(group_result, qtype)
+    with plt.style.context("seaborn-v0_8-whitegrid"):
+        fig = Figure(figsize=(14, 8))
+        ax = fig.subplots()
+
+        x_pos = np.arange(len(df_plot))
+        width = 0.7
+
+        colors = {"max": "#FF6B6B", "mean": "#3FB913", "min": "#2A90D0"}
+
+        # Create overlapping bars with gradient effect
+        ax.bar(x_pos, df_plot["max"], width=width, alpha=0.4, label="Max", color=colors["max"], edgecolor="white", linewidth=1.5)
+        ax.bar(x_pos, df_plot["mean"], width=width, alpha=0.8, label="Mean", color=colors["mean"], edgecolor="white", linewidth=1.5)
+        ax.bar(x_pos, df_plot["min"], width=width, alpha=0.9, label="Min", color=colors["min"], edgecolor="white", linewidth=1.5)
+
+        # Add value labels on top of bars
+        for pos, mean_val, max_val, min_val in zip(x_pos, df_plot["mean"], df_plot["max"], df_plot["min"]):
+
+            ax.text(pos, max_val, f"{max_val:.1f}", ha="center", va="bottom", fontweight="bold", fontsize=9, color=colors["max"])
+            ax.text(pos, mean_val - 0.1, f"{mean_val:.1f}", ha="center", va="center", fontweight="bold", fontsize=9, color="black")
+            ax.text(pos, min_val - 0.1, f"{min_val:.1f}", ha="center", va="center", fontweight="bold", fontsize=9, color="white")
+
+        # Items stopped early (see `pipeline.EarlyStopping`) were scored fewer times, their amount of iterations is shown next to the ID.
+        labels = df_plot["Position"].astype(str)
+        if "count" in df_plot and df_plot["count"].nunique() > 1:
+            labels = labels + " (n=" + df_plot["count"].astype(int).astype(str) + ")"
+        ax.set_xticks(x_pos, labels, rotation=45, ha="right", fontsize=11)
+        ax.set_xlabel(f"Question IDs for qtype: '{qtype}'", fontsize=14, fontweight="bold")
+        ax.set_ylabel("Aggregated Score", fontsize=14, fontweight="bold")
+        ax.set_title("Model Scoring Consistency", fontsize=16, fontweight="bold", pad=20)
+
+        ax.legend(loc="lower right", frameon=True, fancybox=True, shadow=True, fontsize=12, title="Score Statistics", title_fontsize=13)
+        ax.grid(True, alpha=0.3, linestyle="--")
+        fig.tight_layout()
+        fig.subplots_adjust(bottom=0.15)
+        ax.set_facecolor("white")
+
+        img_path.mkdir(exist_ok=True, parents=True)
+        output_file = img_path / f"{qtype}.{fmt}"
+        fig.savefig(output_file, format=fmt, dpi=150)
+
+    return output_file
+
+
+def count(
+    df: Optional[pd.DataFrame] = None,
+    fmt: str = "svg",
+    workers: Optional[int] = None,
+    results_path: Optional[Path] = None,
+    img_path: Optional[Path] = None,
+) -> pd.DataFrame:
+    img_path = img_path or BASE_PATH / "data" / "img"
+
+    # Without a frame the statistics are combined from the incrementally updated `ResultIndex`, which only reads new runs.
+    if df is None:
+        index = ResultIndex(results_path or BASE_PATH / "data" / "results")
+        index.update()
+        stats = index.position_stats()
+    else:
+        # Indexed by (jury, qtype, Position) like the statistics of the index, frames without `JuryModel` count as one jury.
+        frame = df.reset_index()
+        frame[JURY] = jury_models(frame) if "JuryModel" in frame else ""
+        stats = frame.groupby([JURY, "qtype", "Position"])["Score"].agg(["mean", "min", "max", "count"])
+        if "Iteration" in frame:
+            stats["iterations"] = (
+                pd.to_numeric(frame["Iteration"], errors="coerce").groupby([frame[JURY], frame["qtype"], frame["Position"]]).max()
+            )
+
+    juries = stats.index.get_level_values(JURY).nunique()
+    jobs = [
+        (group_result.droplevel([JURY, "qtype"])[["mean", "min", "max", "count"]], qtype, _jury_path(img_path, jury, juries), fmt)
+        for (jury, qtype), group_result in stats.groupby(level=[JURY, "qtype"])
+    ]
+    _render(_create_bar_plot, jobs, workers)
+    return stats
 
 
-def create_scatter(df: pd.DataFrame, qtype, img_path: Path):
+def create_scatter(df: pd.DataFrame, qtype, img_path: Path, fmt: str = "svg") -> Path:
     # Reset index to get Position as a column if needed
     df_plot = df.reset_index()
-    plt.figure(figsize=(14, 8))
-    plt.style.use("seaborn-v0_8-whitegrid")
     unique_positions = df_plot["Position"].unique()
     unique_runs = sorted(df_plot["run_nr"].unique())
 
@@ -116,66 +155,92 @@ def create_scatter(df: pd.DataFrame, qtype, img_path: Path):
     # CRITICAL: offset_range must be smaller than x_spacing to prevent overlap
     offset_range = 3
     offsets = np.linspace(-offset_range / 2, offset_range / 2, len(unique_runs))
-    offset_map = dict(zip(unique_runs, offsets))
-
-    # Create scatter plot with both Score and Answer
-    for run_nr in unique_runs:
-        run_data = df_plot[df_plot["run_nr"] == run_nr]
-        color = color_map[run_nr]
-        offset = offset_map[run_nr]
-        for _, row in run_data.iterrows():
-            # Find the x position for this Position
-            pos_index = np.where(unique_positions == row["Position"])[0][0]
-            # Plot with offset and new spacing
-            x_position = x_pos[pos_index] + offset
-            plot_scatter(x_position, row, "Score", "_", color)
-            plot_scatter(x_position, row, "Answer", "|", color)
-
-    # Set x-axis labels to exact Position values with new spacing
-    plt.xlim(-offset_range / 2 - 1, x_pos[-1] + offset_range / 2 + 2.5)  # Added more right margin
-    plt.xticks(x_pos, unique_positions, ha="right", fontsize=11)
-    plt.yticks(range(6))
-    plt.ylim(0, 5.5)
-
-    # Customize the plot
-    plt.xlabel("Question IDs", fontsize=14, fontweight="bold")
-    plt.ylabel("Scoring Range", fontsize=14, fontweight="bold")
-    plt.title(f"Consistency of Scoring between Numerical and Textual Scoring for {qtype}", fontsize=16, fontweight="bold", pad=20)
-    plt.grid(True, alpha=0.35, linestyle="--")
-    plt.tight_layout()
-    plt.subplots_adjust(bottom=0.15, right=0.85)
-    plt.gca().set_facecolor("white")
-
-    # Make Custom Legends
-    legend_elements = [
-        Line2D([0], [0], marker="_", color="gray", markersize=15, linestyle="None", label="Numerical Score"),
-        Line2D([0], [0], marker="|", color="gray", markersize=15, linestyle="None", label="Textual Score"),
-    ]
-    for run_nr in unique_runs:
-        color = color_map[run_nr]
-        legend_elements.append(Line2D([0], [0], marker="o", color=color, markersize=10, linestyle="None", label=f"Iteration {run_nr[-1]}"))
-    plt.legend(handles=legend_elements, loc="lower right", frameon=True, fancybox=True, shadow=True)
-
-    img_path.mkdir(exist_ok=True, parents=True)
-
-    plt.tight_layout()
-    plt.savefig(f"{img_path}/{qtype}.svg", format="svg")
-
 
-def plot_scatter(x_position, row, column, marker, color):
-    plt.scatter(
-        x_position,
-        row[column],
+    # The x position of every row at once: slot of its Position plus the offset of its run
+    position_codes = pd.Categorical(df_plot["Position"], categories=unique_positions).codes
+    run_codes = pd.Categorical(df_plot["run_nr"], categories=unique_runs).codes
+    x_positions = x_pos[position_codes] + offsets[run_codes]
+
+    scores = pd.to_numeric(df_plot["Score"], errors="coerce").to_numpy()
+    answers = pd.to_numeric(df_plot["Answer"], errors="coerce").to_numpy()
+    rasterized = fmt == "svg" and len(df_plot) > RASTERIZE_ABOVE
+
+    with plt.style.context("seaborn-v0_8-whitegrid"):
+        fig = Figure(figsize=(14, 8))
+        ax = fig.subplots()
+
+        # Create scatter plot with both Score and Answer, one call per run and marker
+        for run_code, run_nr in enumerate(unique_runs):
+            in_run = run_codes == run_code
+            color = color_map[run_nr]
+            plot_scatter(ax, x_positions[in_run], scores[in_run], "_", color, rasterized)
+            plot_scatter(ax, x_positions[in_run], answers[in_run], "|", color, rasterized)
+
+        # Set x-axis labels to exact Position values with new spacing
+        ax.set_xlim(-offset_range / 2 - 1, x_pos[-1] + offset_range / 2 + 2.5)  # Added more right margin
+        ax.set_xticks(x_pos, unique_positions, ha="right", fontsize=11)
+        ax.set_yticks(range(6))
+        ax.set_ylim(0, 5.5)
+
+        # Customize the plot
+        ax.set_xlabel("Question IDs", fontsize=14, fontweight="bold")
+        ax.set_ylabel("Scoring Range", fontsize=14, fontweight="bold")
+        ax.set_title(f"Consistency of Scoring between Numerical and Textual Scoring for {qtype}", fontsize=16, fontweight="bold", pad=20)
+        ax.grid(True, alpha=0.35, linestyle="--")
+        fig.tight_layout()
+        fig.subplots_adjust(bottom=0.15, right=0.85)
+        ax.set_facecolor("white")
+
+        # Make Custom Legends
+        legend_elements = [
+            Line2D([0], [0], marker="_", color="gray", markersize=15, linestyle="None", label="Numerical Score"),
+            Line2D([0], [0], marker="|", color="gray", markersize=15, linestyle="None", label="Textual Score"),
+        ]
+        for run_nr in unique_runs:
+            color = color_map[run_nr]
+            legend_elements.append(
+                Line2D([0], [0], marker="o", color=color, markersize=10, linestyle="None", label=f"Iteration {run_nr.rsplit('_', 1)[-1]}")
+            )
+        ax.legend(handles=legend_elements, loc="lower right", frameon=True, fancybox=True, shadow=True)
+
+        img_path.mkdir(exist_ok=True, parents=True)
+
+        fig.tight_layout()
+        output_file = img_path / f"{qtype}.{fmt}"
+        fig.savefig(output_file, format=fmt, dpi=150)
+
+    return output_file
+
+
+def plot_scatter(ax, x_positions: np.ndarray, values: np.ndarray, marker: str, color: str, rasterized: bool = False):
+    ax.scatter(
+        x_positions,
+        values,
         color=color,
         marker=marker,
         s=250,
         alpha=0.8,
         edgecolors="white",
         linewidth=2,
+        rasterized=rasterized,
     )
 
 
-def scatter_plot(dfs: List[pd.DataFrame], img_path: Path = BASE_PATH / "data" / "img" / "scatterplot"):
+def scatter_plot(
+    dfs: List[pd.DataFrame],
+    img_path: Path = BASE_PATH / "data" / "img" / "scatterplot",
+    fmt: str = "svg",
+    workers: Optional[int] = None,
+):
+    """Renders one scatter plot per qtype.
+
+    Args:
+        dfs (List[pd.DataFrame]): Results with the columns `Answer`, `Score`, `qtype` and `run_nr`, indexed by `Position`. An optional
+            `jury` column splits them into one plot per jury and qtype.
+        img_path (Path, optional): Output directory. Defaults to `data/img/scatterplot`.
+        fmt (str, optional): Any format `savefig` supports, "png" keeps the files small for large datasets. Defaults to "svg".
+        workers (Optional[int], optional): Processes rendering the qtypes in parallel, `1` renders within this process. Defaults to the CPU count.
+    """
     replacement_map = {
         "No semantic relation at all meaning": 1.0,
         "Same domain, but no matching semantical meaning": 2.0,
@@ -187,12 +252,12 @@ def scatter_plot(dfs: List[pd.DataFrame], img_path: Path = BASE_PATH / "data" /
     merged = pd.concat(dfs)
     merged.Answer = merged.Answer.replace((replacement_map))
 
-    qtypes = merged["qtype"].unique()
+    if JURY not in merged:
+        merged[JURY] = ""
+    juries = merged[JURY].nunique()
 
-    # Group by qtype and plot all runs together
-    for qtype in qtypes:
-        # Get all data for this qtype across all runs
-        qtype_data = merged[merged["qtype"] == qtype]
-        create_scatter(qtype_data, qtype, img_path=img_path)
+    # Group by jury and qtype and plot all runs together
+    jobs = [(group, qtype, _jury_path(img_path, jury, juries), fmt) for (jury, qtype), group in merged.groupby([JURY, "qtype"], sort=False)]
+    _render(create_scatter, jobs, workers)
 
     print(f"\nSaved all files within: '{img_path}'\n")
@@ -1,33 +1,66 @@
 import pandas as pd
 from pathlib import Path
-from utils import BASE_PATH
+from utils import RESULTS_PATH, load_results
+
+from .index import JURY, ResultIndex, balanced_counts, jury_models
 
 
 class ScoreComparison:
-    def __init__(self, csv_dir_path: Path | str = ""):
+    def __init__(self, csv_dir_path: Path | str = "", incremental: bool = True, balanced: bool = False):
         self.dfs: pd.DataFrame = None
-        self.csv_dir = csv_dir_path if csv_dir_path else Path(BASE_PATH, "data", "results")
-        self._load_csvs()
+        # Weights up the items that were stopped early, see `analysis.index.balanced_counts`
+        self.balanced = balanced
+        self.index: ResultIndex = None
+        self.csv_dir = Path(csv_dir_path) if csv_dir_path else RESULTS_PATH
+
+        # The index only reads runs that were added since the last invocation, otherwise every result file is loaded.
+        if incremental:
+            self.index = ResultIndex(self.csv_dir)
+            print(f"Indexed {self.index.update()} new or changed result files")
+        else:
+            self._load_results()
 
-    def _load_csvs(self):
-        csv_files = [path for path in self.csv_dir.glob("**/*") if path.is_file() and path.suffix == ".csv"]
+    def _load_results(self):
+        # Only the needed columns are read from the (columnar) result files, the items and their iterations only for `balanced`.
+        if self.balanced:
+            columns = ["Position", "Score", "Answer", "JuryModel", "Iteration"]
+            dfs = load_results(self.csv_dir, columns=columns, partitions=["judge", "dataset", "date", "qtype"])
+        else:
+            dfs = load_results(self.csv_dir, columns=["Score", "Answer"])
 
-        csvs = []
-        if not csv_files:
+        if dfs.empty:
             print(f"No files were found within the {self.csv_dir.name} directory, aborting...")
             return None
 
-        for csv in csv_files:
-            csvs.append(pd.read_csv(csv, usecols=["Score", "Answer"]))
+        self.dfs = dfs
+
+    def _pair_counts(self) -> pd.DataFrame:
+        if self.index is not None:
+            return self.index.pair_counts(balanced=self.balanced)
 
-        self.dfs = pd.concat(csvs)
+        answers = self.dfs["Answer"].astype(object).str.replace('"', "", regex=False)
+        pairs = pd.DataFrame({"Answer": answers, "Score": self.dfs["Score"]})
+        if not self.balanced:
+            return pairs.value_counts(dropna=False).rename("count").reset_index()
+
+        # One row per item and iteration, `balanced_counts` takes the last `Iteration` of every item from them
+        pairs = pairs.assign(
+            **{name: self.dfs[name].astype(str) for name in ["judge", "dataset", "date", "qtype"]},
+            **{JURY: jury_models(self.dfs), "Position": self.dfs["Position"]},
+            count=1,
+            iterations=pd.to_numeric(self.dfs["Iteration"], errors="coerce"),
+        )
+        pairs["count"] = balanced_counts(pairs)
+        return pairs.groupby(["Answer", "Score"], dropna=False)["count"].sum().reset_index()
 
     def count(self):
-        answers = self.dfs["Answer"].str.replace('"', "", regex=False)
-        print(answers.value_counts(dropna=False))
+        pairs = self._pair_counts()
+
+        answers = pairs.groupby("Answer", dropna=False)["count"].sum().sort_values(ascending=False)
+        print(answers)
 
-        score = self.dfs["Score"]
-        print(score.value_counts(dropna=False))
+        score = pairs.groupby("Score", dropna=False)["count"].sum().sort_values(ascending=False)
+        print(score)
 
         # Check if any textual scores had a higher score than numericals.
         replacement_map = {
@@ -37,7 +70,7 @@ class ScoreComparison:
             "Great match in semantical meaning": 4.0,
             "Identical semantic meaning": 5.0,
         }
-        self.dfs["Answer"] = self.dfs["Answer"].str.replace('"', "", regex=False).replace(replacement_map).fillna(0.0)
+        pairs["Answer"] = pd.to_numeric(pairs["Answer"].map(replacement_map), errors="coerce").fillna(0.0)
 
-        subset = self.dfs[self.dfs["Answer"] > self.dfs["Score"]]
-        print(subset.value_counts())
+        subset = pairs[pairs["Answer"] > pairs["Score"]]
+        print(subset.groupby(["Answer", "Score"])["count"].sum().sort_values(ascending=False))
@@ -0,0 +1,4 @@
+from .run import BENCHMARK_PATH, run_benchmark
+from .server import MockServer, MockServerConfig
+
+__all__ = ["MockServer", "MockServerConfig", "run_benchmark"]
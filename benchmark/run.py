@@ -0,0 +1,168 @@
+import json
+import resource
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from analysis import ScoreComparison
+from analysis.plots import make_plots
+from court import Judge, Jury
+from pipeline import Pipeline
+from pipeline.metrics import summarize_calls
+from utils import BASE_PATH, BalancedGenerator, ClientConfig
+
+from .server import MockServer, MockServerConfig
+
+BENCHMARK_PATH: Path = BASE_PATH / "data" / "benchmarks"
+
+
+def _cpu_seconds() -> float:
+    # Processes of the plot pool are accounted to the children once they were reaped.
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+@contextmanager
+def _stage(stages: Dict[str, Dict[str, float]], name: str) -> Iterator[Dict[str, float]]:
+    stage: Dict[str, float] = {}
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    yield stage
+    stage["wall_seconds"] = time.perf_counter() - wall
+    stage["cpu_seconds"] = _cpu_seconds() - cpu
+    if "items" in stage:
+        stage["items_per_second"] = stage["items"] / stage["wall_seconds"] if stage["wall_seconds"] > 0 else float("nan")
+    stages[name] = stage
+
+
+def _write_datasets(csv_dir: Path, datasets: int, rows: int, qtypes: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    csv_dir.mkdir(parents=True, exist_ok=True)
+    for dataset in range(datasets):
+        qtype = rng.integers(0, qtypes, size=rows)
+        pd.DataFrame(
+            {
+                "qtype": [f"qtype_{value}" for value in qtype],
+                "Question": [f"What is the treatment of condition {dataset}-{row}?" for row in range(rows)],
+                "Answer": [f"Condition {dataset}-{row} is treated with rest and fluids." for row in range(rows)],
+            }
+        ).to_csv(csv_dir / f"dataset_{dataset}.csv", index=False)
+
+
+def run_benchmark(
+    questions: int = 10,
+    iterations: int = 2,
+    datasets: int = 2,
+    rows: int = 5_000,
+    qtypes: int = 8,
+    max_concurrency: int = 16,
+    server_config: Optional[MockServerConfig] = None,
+    analysis: bool = True,
+    output: Path | str = "",
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """Runs the generator, the pipeline and the analysis end to end against a local mock server and reports their performance.
+
+    Args:
+        questions (int, optional): Questions sampled per qtype. Defaults to 10.
+        iterations (int, optional): Amount of `Pipeline.query` runs. Defaults to 2.
+        datasets (int, optional): Amount of synthetic datasets. Defaults to 2.
+        rows (int, optional): Rows per synthetic dataset. Defaults to 5_000.
+        qtypes (int, optional): Distinct qtypes per dataset. Defaults to 8.
+        max_concurrency (int, optional): Requests in flight per model. Defaults to 16.
+        server_config (Optional[MockServerConfig], optional): Latency, token rate and failure injection of the mock server. Defaults to None.
+        analysis (bool, optional): Also time `make_plots` and `ScoreComparison`. Defaults to True.
+        output (Path | str, optional): JSON file the report is written to. Defaults to `data/benchmarks/benchmark-<timestamp>.json`.
+        seed (int, optional): Seed of the datasets and the sampling. Defaults to 42.
+
+    Returns:
+        Dict[str, Any]: The report, stage timings (wall / CPU seconds, items per second), request statistics, peak RSS and server counters.
+    """
+    server_config = server_config or MockServerConfig(seed=seed)
+    stages: Dict[str, Dict[str, float]] = {}
+    calls = []
+
+    with tempfile.TemporaryDirectory(prefix="judgely-benchmark-") as tmp, MockServer(server_config) as server:
+        tmp_path = Path(tmp)
+        _write_datasets(tmp_path / "csv", datasets, rows, qtypes, seed)
+
+        # The first generator converts the csv files into the Arrow cache, the second one measures the warm start.
+        for name in ("generator_cold", "generator_warm"):
+            with _stage(stages, name) as stage:
+                generator = BalancedGenerator(tmp_path / "csv", cache_dir=tmp_path / "cache")
+                generator.generate_set(seed=seed, amount=questions)
+                stage["items"] = sum(len(dataholder.questions) for dataholder in generator.data)
+
+        config = ClientConfig(server.base_url, "mock")
+        jury = Jury(model="mock-jury", client_config=config, max_concurrency=max_concurrency)
+        judge = Judge(model="mock-judge", client_config=config, max_concurrency=max_concurrency)
+        pipeline = Pipeline(judge=judge, jury=jury, generator=generator, results_root=tmp_path / "results", metrics_format=None)
+
+        with _stage(stages, "query") as stage:
+            for _ in range(iterations):
+                pipeline.query(max_completion_tokens=2048)
+                calls.append(pipeline.metrics.frame())
+            stage["items"] = iterations * stages["generator_warm"]["items"]
+
+        if analysis:
+            with _stage(stages, "plots"):
+                make_plots(fmt="png", results_path=tmp_path / "results", img_path=tmp_path / "img")
+            with _stage(stages, "scores"):
+                ScoreComparison(tmp_path / "results").count()
+
+        server_stats = server.stats()
+
+    requests = summarize_calls(pd.concat(calls, ignore_index=True), stages["query"]["wall_seconds"])
+    # `ru_maxrss` is reported in kilobytes on Linux
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "parameters": {
+            "questions": questions,
+            "iterations": iterations,
+            "datasets": datasets,
+            "rows": rows,
+            "qtypes": qtypes,
+            "max_concurrency": max_concurrency,
+            "seed": seed,
+        },
+        "server_config": asdict(server_config),
+        "stages": stages,
+        "requests": json.loads(requests.to_json(orient="records")),
+        "server": server_stats,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "peak_rss_children_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+    output_file = Path(output) if output else BENCHMARK_PATH / f"benchmark-{datetime.now():%Y-%m-%d-%H%M%S}.json"
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    output_file.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    _print_report(report, output_file)
+    return report
+
+
+def _print_report(report: Dict[str, Any], output_file: Path) -> None:
+    print("\n[benchmark] stage           wall [s]   cpu [s]   items/s")
+    for name, stage in report["stages"].items():
+        print(
+            f"[benchmark] {name:<15} {stage['wall_seconds']:>8.2f}  {stage['cpu_seconds']:>8.2f}  {stage.get('items_per_second', float('nan')):>8.1f}"
+        )
+
+    for row in report["requests"]:
+        print(
+            f"[benchmark] {row['stage']} '{row['model']}': {row['calls']} calls, latency p50 {row['latency_p50']:.3f}s / p95 {row['latency_p95']:.3f}s, "
+            f"{row['requests_per_second']:.1f} requests/s"
+        )
+
+    print(f"[benchmark] peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB, server {report['server']}")
+    print(f"[benchmark] report written to '{output_file}'")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,287 @@
+import json
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from court import JUDGE_ANSWERS
+
+FILLER_WORDS = ("the", "answer", "depends", "on", "the", "symptoms", "and", "their", "treatment", "options")
+
+
+@dataclass
+class MockServerConfig:
+    """Behaviour of the mock `/v1/chat/completions` endpoint.
+
+    Args:
+        latency_median (float, optional): Median seconds until the first token, drawn from a log-normal distribution. Defaults to 0.2.
+        latency_sigma (float, optional): Shape of the log-normal distribution, 0 makes the latency constant. Defaults to 0.5.
+        tokens_per_second (float, optional): Generation speed of every request, 0 returns the completion instantly. Defaults to 200.0.
+        completion_tokens (int, optional): Mean length of the jury replies, the judge replies are short verdicts. Defaults to 128.
+        think_ratio (float, optional): Share of the jury reply within a '<think> ... </think>' block. Defaults to 0.5.
+        error_rate (float, optional): Probability of answering with status 500. Defaults to 0.0.
+        throttle_rate (float, optional): Probability of answering with status 429 and a `Retry-After` header. Defaults to 0.0.
+        retry_after (float, optional): Seconds sent within `Retry-After`. Defaults to 0.5.
+        seed (Optional[int], optional): Seed of the latency, length and failure draws. Defaults to None.
+    """
+
+    latency_median: float = 0.2
+    latency_sigma: float = 0.5
+    tokens_per_second: float = 200.0
+    completion_tokens: int = 128
+    think_ratio: float = 0.5
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: float = 0.5
+    seed: Optional[int] = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, the clients reuse their pooled connections like they would with a real server.
+    protocol_version = "HTTP/1.1"
+    server: "_MockHTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "benchmark"}]})
+        elif self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path '{self.path}'"}})
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": f"Unknown path '{self.path}'"}})
+            return
+
+        outcome, ttft, length = self.server.draw()
+        if outcome == "throttled":
+            self._send_json(429, {"error": {"message": "Rate limit reached"}}, {"retry-after": str(self.server.config.retry_after)})
+            return
+        if outcome == "error":
+            self._send_json(500, {"error": {"message": "Injected server error"}})
+            return
+
+        messages: List[Dict[str, Any]] = body.get("messages", [])
+        content = self.server.reply(messages, body.get("response_format"), length)
+        words = content.split(" ")
+        usage = {
+            "prompt_tokens": len(json.dumps(messages)) // 4,
+            "completion_tokens": len(words),
+            "total_tokens": len(json.dumps(messages)) // 4 + len(words),
+        }
+
+        time.sleep(ttft)
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._stream(body.get("model", "mock"), words, usage if include_usage else None)
+            return
+
+        tokens_per_second = self.server.config.tokens_per_second
+        if tokens_per_second > 0:
+            time.sleep(len(words) / tokens_per_second)
+
+        self._send_json(
+            200,
+            {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            },
+        )
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model: str, words: List[str], usage: Optional[Dict[str, int]]) -> None:
+        def send_event(payload: str) -> None:
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+            choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else []
+            payload = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+            }
+            return json.dumps({**payload, **extra})
+
+        tokens_per_second = self.server.config.tokens_per_second
+        try:
+            # Within the try, the client may have given up on the request before its first token
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            for index, word in enumerate(words):
+                send_event(chunk({"role": "assistant", "content": word if index == 0 else " " + word}))
+                if tokens_per_second > 0:
+                    time.sleep(1 / tokens_per_second)
+            send_event(chunk({}, "stop"))
+            if usage is not None:
+                send_event(chunk(None, usage=usage))
+            send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early, e.g. once the verdict was complete.
+            self.server.count("cancelled")
+            self.close_connection = True
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections once the client opens its whole pool at once.
+    request_queue_size = 256
+
+    def __init__(self, address: tuple, config: MockServerConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "completed": 0, "errors": 0, "throttled": 0, "cancelled": 0}
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients that gave up on a request reset its connection, e.g. while a non-streamed reply is written or the next request is read.
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def draw(self) -> tuple[str, float, int]:
+        config = self.config
+        with self._lock:
+            self._stats["requests"] += 1
+            roll = self._random.random()
+            if roll < config.throttle_rate:
+                self._stats["throttled"] += 1
+                return "throttled", 0.0, 0
+            if roll < config.throttle_rate + config.error_rate:
+                self._stats["errors"] += 1
+                return "error", 0.0, 0
+
+            self._stats["completed"] += 1
+            ttft = (
+                config.latency_median * math.exp(self._random.gauss(0.0, config.latency_sigma))
+                if config.latency_sigma
+                else config.latency_median
+            )
+            length = max(1, int(self._random.expovariate(1 / config.completion_tokens))) if config.completion_tokens else 1
+            return "ok", ttft, length
+
+    def reply(self, messages: List[Dict[str, Any]], response_format: Optional[Dict[str, Any]], length: int) -> str:
+        question = str(messages[-1].get("content", "")) if messages else ""
+
+        # Batched judge requests number their items, see `court.judge.batch_message`, and are always answered with JSON.
+        if question.startswith("Item 1:"):
+            verdicts = []
+            with self._lock:
+                for item in range(1, question.count("\n\nItem ") + 2):
+                    score = self._random.randint(1, len(JUDGE_ANSWERS))
+                    verdicts.append(
+                        {
+                            "Item": item,
+                            "Answer": JUDGE_ANSWERS[score - 1],
+                            "Score": score,
+                            "Reason": "Both answers name the same treatment.",
+                        }
+                    )
+            return json.dumps({"Verdicts": verdicts})
+
+        # Judge requests are recognised by the '1: <gold answer> 2: <jury reply>' layout of `pipeline.parsing.build_judge_message`.
+        if question.startswith("1:"):
+            with self._lock:
+                score = self._random.randint(1, len(JUDGE_ANSWERS))
+            reason = "Both answers name the same treatment."
+            if response_format is not None:
+                return json.dumps({"Answer": JUDGE_ANSWERS[score - 1], "Score": score, "Reason": reason})
+            # Verbose judges keep talking after their verdict, a streaming client can stop reading once the reason line has ended.
+            chatter = " ".join(FILLER_WORDS[index % len(FILLER_WORDS)] for index in range(length))
+            return f"- Answer: {JUDGE_ANSWERS[score - 1]}\n- Score: {score}\n- Reason: {reason}\n{chatter}"
+
+        thinking = int(length * self.config.think_ratio)
+        think_words = " ".join(FILLER_WORDS[index % len(FILLER_WORDS)] for index in range(thinking))
+        answer_words = " ".join(FILLER_WORDS[index % len(FILLER_WORDS)] for index in range(max(1, length - thinking)))
+        return f"<think> {think_words} </think> {answer_words}" if thinking else answer_words
+
+
+def _serve(config: MockServerConfig, host: str, port: int, ready: Any) -> None:
+    server = _MockHTTPServer((host, port), config)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class MockServer:
+    """OpenAI compatible chat server with a configurable latency distribution, token rate and error / 429 injection.
+
+    It runs in its own process, so that it neither competes with the benchmarked client for the GIL nor shows up in its CPU time.
+
+    Usage:
+        with MockServer(MockServerConfig(throttle_rate=0.05)) as server:
+            config = ClientConfig(server.base_url, "mock")
+    """
+
+    def __init__(self, config: Optional[MockServerConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockServerConfig()
+        self.host = host
+        self.port = port
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/"
+
+    def start(self) -> "MockServer":
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        self._process = context.Process(target=_serve, args=(self.config, self.host, self.port, ready), daemon=True)
+        self._process.start()
+        # `port=0` lets the OS pick a free port, the server reports the one it bound.
+        self.port = ready.get(timeout=30)
+        return self
+
+    def stats(self) -> Dict[str, int]:
+        return httpx.get(f"http://{self.host}:{self.port}/stats").json()
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
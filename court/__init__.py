@@ -1,4 +1,7 @@
+from .base import ChatResult as ChatResult
+from .judge import JUDGE_ANSWERS as JUDGE_ANSWERS
 from .judge import Judge as Judge
 from .jury import Jury as Jury
+from .pool import EndpointPool as EndpointPool
 
 __all__ = ["Judge, Jury"]
@@ -1,31 +1,177 @@
+import json
+import random
+import time
 from abc import ABC
-from typing import Optional, final
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, final
 
-from openai import OpenAI
+from openai import APIConnectionError, APIStatusError
 from openai.types.chat import ChatCompletion
 
-from utils import ClientConfig, Message
+from utils import ClientConfig, Message, ResponseCache
+
+from .clients import DEFAULT_CLIENT_CONFIG, get_pool
+from .ratelimit import parse_retry_after
+from .streaming import StreamedCompletion, VerdictParser, read_stream
+
+
+@dataclass
+class ChatResult:
+    content: str
+    seconds: float
+    cached: bool = False
+    # Token usage as reported by the server, None for cache hits and servers that do not report it.
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Seconds until the first token arrived, only known for streamed requests.
+    ttft: Optional[float] = None
 
 
 class BaseTemplate(ABC):
 
-    def __init__(self, model: str, system_message: Optional[str] = "", *, client_config: Optional[ClientConfig] = None):
-        self.client = (
-            OpenAI(base_url=client_config.base_url, api_key=client_config.api_key)
-            if client_config
-            else OpenAI(base_url="http://localhost:11434/v1/", api_key="ollama")
-        )
+    def __init__(
+        self,
+        model: str,
+        system_message: Optional[str] = "",
+        *,
+        client_config: Optional[ClientConfig] = None,
+        max_concurrency: int = 1,
+        cache: Optional[ResponseCache] = None,
+        stream: bool = False,
+    ):
+        self.client_config = client_config or DEFAULT_CLIENT_CONFIG
+        # Every call picks one of the config's endpoints, each with its own client and rate limiter.
+        self.pool = get_pool(self.client_config)
 
         self.model = model
         self.system_message = system_message
         self.system_message_dict = {"role": "system", "content": system_message}
+        self.cache = cache
+        # Default parameters of every request of this model, the keyword arguments of `chat` / `complete` take precedence.
+        self.chat_params: Dict[str, Any] = {}
+        # Streamed requests report their time to first token and may be cut off early, see `_stream_parser`.
+        self.stream = stream
+
+        # Upper bound of requests this model has in flight at once; the executor is shared by every `submit` / `chat_many` call.
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=self.__class__.__name__)
+
+    @final
+    def chat(self, message: Message, *, bypass_cache: bool = False, **kwargs) -> str | None:
+        return self.complete(message, bypass_cache=bypass_cache, **kwargs).content
 
     @final
-    def chat(self, message: Message, **kwargs) -> str | None:
-        messages = [self.system_message_dict] + [message]
-        chat_params = {"temperature": 0.0, **kwargs}
+    def complete(self, message: Message, *, bypass_cache: bool = False, system_message: Optional[str] = None, **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        # `system_message` replaces the model's own one for this request only, e.g. for the batched requests of a `Judge`.
+        system_message_dict = self.system_message_dict if system_message is None else {"role": "system", "content": system_message}
+        messages = [system_message_dict] + [message]
+        chat_params = {"temperature": 0.0, **self.chat_params, **kwargs}
+
+        # `bypass_cache` skips the lookup (e.g. for iteration studies that repeat requests on purpose), the fresh reply is still stored.
+        cache_key = ResponseCache.make_key(self.model, messages, chat_params) if self.cache else None
+        if cache_key and not bypass_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return ChatResult(content=cached, seconds=time.perf_counter() - start, cached=True)
 
         # set the `temperature` to `0.0` to have consistency in the evaluation. Might lead to worse results at times, but we rather want to be consistency (slightly) worse than have random lucky shots of success.
-        response: ChatCompletion = self.client.chat.completions.create(messages=messages, model=self.model, **chat_params)
+        response = self._create(messages, chat_params)
+        if isinstance(response, StreamedCompletion):
+            content = response.content
+        else:
+            content = response.choices[0].message.content
+
+        # Failed chats are not cached, they should be retried on the next run.
+        if cache_key and content:
+            self.cache.set(cache_key, self.model, content)
+
         # This returns the raw string output of the model. If it's a 'thinking' capable mode, then the '<think> ... </think>' content is included within the string.
-        return response.choices[0].message.content or f"Chatting with {self.__class__.__name__} has failed."
+        usage = response.usage
+        streamed = isinstance(response, StreamedCompletion)
+        return ChatResult(
+            content=content or f"Chatting with {self.__class__.__name__} has failed.",
+            seconds=time.perf_counter() - start,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            # A stream that was cut off never gets the usage chunk, its content chunks are close to the tokens generated.
+            completion_tokens=usage.completion_tokens if usage else (response.chunks if streamed else None),
+            ttft=response.ttft if streamed else None,
+        )
+
+    def _stream_parser(self) -> Optional[VerdictParser]:
+        """Parser deciding when a streamed reply is complete, None reads every stream to its end."""
+        return None
+
+    def _create(self, messages: List[Dict[str, Any]], chat_params: Dict[str, Any]) -> ChatCompletion | StreamedCompletion:
+        # Rough estimate (~4 characters per token) of what the request costs, corrected with the reported usage afterwards.
+        max_completion = chat_params.get("max_completion_tokens") or chat_params.get("max_tokens") or 0
+        estimated_tokens = len(json.dumps(messages, ensure_ascii=False)) // 4 + max_completion
+
+        max_retries = self.client_config.max_retries
+        for attempt in range(max_retries + 1):
+            # Picked per attempt, a retry goes to whichever endpoint is the best choice by then.
+            endpoint = self.pool.acquire()
+            endpoint.rate_limiter.acquire(tokens=estimated_tokens)
+            start = time.perf_counter()
+
+            try:
+                if self.stream:
+                    stream = endpoint.client.chat.completions.create(
+                        messages=messages, model=self.model, stream=True, stream_options={"include_usage": True}, **chat_params
+                    )
+                    response = read_stream(stream, start, self._stream_parser())
+                else:
+                    response = endpoint.client.chat.completions.create(messages=messages, model=self.model, **chat_params)
+            except APIStatusError as error:
+                throttled = error.status_code in (429, 503)
+                retry_after = (parse_retry_after(error.response.headers) or self._backoff(attempt)) if throttled else None
+                endpoint.rate_limiter.release(throttled=throttled, retry_after=retry_after)
+                self.pool.release(endpoint, failed=not throttled and error.status_code >= 500)
+
+                if attempt == max_retries or not (throttled or error.status_code >= 500):
+                    raise
+                print(f"[{self.model}] status {error.status_code} from '{endpoint.base_url}', retrying ({attempt + 1}/{max_retries})")
+
+                # Throttled requests wait within `acquire` until `retry_after` has passed.
+                if not throttled:
+                    time.sleep(self._backoff(attempt))
+                continue
+            except APIConnectionError:
+                endpoint.rate_limiter.release()
+                self.pool.release(endpoint, failed=True)
+
+                if attempt == max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            except BaseException:
+                endpoint.rate_limiter.release()
+                self.pool.release(endpoint)
+                raise
+
+            latency = time.perf_counter() - start
+            usage = response.usage
+            completion_tokens = usage.completion_tokens if usage else getattr(response, "chunks", 0)
+            endpoint.rate_limiter.release(
+                latency=latency,
+                completion_tokens=completion_tokens,
+                token_correction=usage.total_tokens - estimated_tokens if usage else 0,
+            )
+            self.pool.release(endpoint, latency=latency, completion_tokens=completion_tokens)
+            return response
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(30.0, 0.5 * 2**attempt) * random.uniform(0.5, 1.0)
+
+    @final
+    def submit(self, message: Message, **kwargs) -> Future:
+        """Schedules `complete` on this model's executor, the future resolves to a `ChatResult`."""
+        return self._executor.submit(self.complete, message, **kwargs)
+
+    @final
+    def chat_many(self, messages: List[Message], **kwargs) -> List[str | None]:
+        # The replies are collected in the order of `messages`, regardless of which request finishes first.
+        futures = [self.submit(message, **kwargs) for message in messages]
+        return [future.result().content for future in futures]
@@ -0,0 +1,112 @@
+import atexit
+import importlib.util
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+from utils import ClientConfig, Endpoint
+
+from .pool import EndpointPool, EndpointState
+from .ratelimit import RateLimiter
+
+DEFAULT_CLIENT_CONFIG = ClientConfig(base_url="http://localhost:11434/v1/", api_key="ollama")
+
+HTTP2_AVAILABLE: bool = importlib.util.find_spec("h2") is not None
+
+_clients: Dict[ClientConfig, OpenAI] = {}
+# Limiter of every `base_url` together with the limits it was created with
+_rate_limiters: Dict[str, Tuple[RateLimiter, Dict[str, Optional[float]]]] = {}
+_pools: Dict[ClientConfig, EndpointPool] = {}
+_lock = threading.Lock()
+
+
+def get_client(client_config: Optional[ClientConfig] = None) -> OpenAI:
+    """Returns the shared client of `client_config`, every `Judge` / `Jury` with an equal config reuses the same keep-alive pool.
+
+    Args:
+        client_config (Optional[ClientConfig], optional): Endpoint and pool settings. Defaults to the local ollama server.
+
+    Returns:
+        OpenAI: Client that is created once per distinct `ClientConfig`.
+    """
+    client_config = client_config or DEFAULT_CLIENT_CONFIG
+
+    with _lock:
+        client = _clients.get(client_config)
+        if client is None:
+            http_client = DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=client_config.max_connections,
+                    max_keepalive_connections=client_config.max_keepalive_connections,
+                ),
+                timeout=httpx.Timeout(client_config.timeout, connect=client_config.connect_timeout),
+                http2=client_config.http2 and HTTP2_AVAILABLE,
+            )
+            # Retries are handled by `BaseTemplate.chat`, so that the rate limiter gets to see every 429/503.
+            client = OpenAI(base_url=client_config.base_url, api_key=client_config.api_key, http_client=http_client, max_retries=0)
+            _clients[client_config] = client
+
+    return client
+
+
+def get_rate_limiter(client_config: Optional[ClientConfig] = None) -> RateLimiter:
+    """Returns the rate limiter of the endpoint, which is shared by all configs (and therefore all models) pointing at the same `base_url`.
+
+    Raises:
+        ValueError: If another config of the same `base_url` already created the limiter with different limits.
+    """
+    client_config = client_config or DEFAULT_CLIENT_CONFIG
+    limits = {
+        "requests_per_second": client_config.requests_per_second,
+        "tokens_per_minute": client_config.tokens_per_minute,
+        "max_concurrency": client_config.max_connections,
+    }
+
+    with _lock:
+        entry = _rate_limiters.get(client_config.base_url)
+        if entry is None:
+            entry = _rate_limiters[client_config.base_url] = (RateLimiter(**limits), limits)
+        elif entry[1] != limits:
+            # One server has one budget, silently applying the limits of whichever config came first would hide the mismatch.
+            raise ValueError(f"The rate limits of '{client_config.base_url}' are already set to {entry[1]}, got {limits}")
+
+    return entry[0]
+
+
+def get_pool(client_config: Optional[ClientConfig] = None) -> EndpointPool:
+    """Returns the shared endpoint pool of `client_config`, so that the routing sees the requests of every model using it.
+
+    Each endpoint reuses the client and rate limiter of a config that only differs in `base_url` / `api_key`.
+    """
+    client_config = client_config or DEFAULT_CLIENT_CONFIG
+
+    with _lock:
+        pool = _pools.get(client_config)
+    if pool is not None:
+        return pool
+
+    endpoints = client_config.endpoints or (Endpoint(client_config.base_url, client_config.api_key),)
+    states = []
+    for endpoint in endpoints:
+        endpoint_config = client_config._replace(
+            base_url=endpoint.base_url, api_key=endpoint.api_key or client_config.api_key, endpoints=()
+        )
+        states.append(EndpointState(endpoint, get_client(endpoint_config), get_rate_limiter(endpoint_config)))
+
+    with _lock:
+        return _pools.setdefault(client_config, EndpointPool(client_config, states))
+
+
+def close_clients() -> None:
+    with _lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+atexit.register(close_clients)
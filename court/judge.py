@@ -1,8 +1,89 @@
-from typing import Optional
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence
 
-from utils import ClientConfig
+from utils import ClientConfig, Message, MessageTemplate, ResponseCache
 
 from .base import BaseTemplate
+from .streaming import VerdictParser
+
+JUDGE_ANSWERS: List[str] = [
+    "No semantic relation at all",
+    "Same domain, but no matching semantical meaning",
+    "Some matching semantical meaning",
+    "Great match in semantical meaning",
+    "Identical semantic meaning",
+]
+
+JUDGE_SYSTEM_MESSAGE = """You are an assistant that receives two text snippets and must compare their semantic meaning. You will always responds in the following format:
+            - Answer, either one of those rankings: ["No semantic relation at all", "Same domain, but no matching semantical meaning", "Some matching semantical meaning", "Great match in semantical meaning", "Identical semantic meaning"]
+            - Score: a score from 1 to 5 of how semantically similar they are.
+            - Reason: a reasoning for your choice of score.
+            """
+
+JUDGE_STRUCTURED_SYSTEM_MESSAGE = """You are an assistant that receives two text snippets and must compare their semantic meaning. You will always respond with a JSON object containing:
+            - "Answer", either one of those rankings: ["No semantic relation at all", "Same domain, but no matching semantical meaning", "Some matching semantical meaning", "Great match in semantical meaning", "Identical semantic meaning"]
+            - "Score": a score from 1 to 5 of how semantically similar they are.
+            - "Reason": a reasoning for your choice of score.
+            """
+
+JUDGE_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "verdict",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "Answer": {"type": "string", "enum": JUDGE_ANSWERS},
+                "Score": {"type": "integer", "minimum": 1, "maximum": 5},
+                "Reason": {"type": "string"},
+            },
+            "required": ["Answer", "Score", "Reason"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+JUDGE_BATCH_SYSTEM_MESSAGE = """You are an assistant that receives numbered items, each with two text snippets, and must compare the semantic meaning of the snippets of every item on its own. You will always respond with a JSON object containing "Verdicts", a list with one object per item:
+            - "Item": the number of the item.
+            - "Answer", either one of those rankings: ["No semantic relation at all", "Same domain, but no matching semantical meaning", "Some matching semantical meaning", "Great match in semantical meaning", "Identical semantic meaning"]
+            - "Score": a score from 1 to 5 of how semantically similar they are.
+            - "Reason": a reasoning for your choice of score.
+            """
+
+JUDGE_BATCH_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "verdicts",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "Verdicts": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "Item": {"type": "integer", "minimum": 1},
+                            **JUDGE_RESPONSE_FORMAT["json_schema"]["schema"]["properties"],
+                        },
+                        "required": ["Item", "Answer", "Score", "Reason"],
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["Verdicts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def batch_message(messages: List[Message]) -> Message:
+    """Packs several judge requests into one, numbered from 1 in the order of `messages`."""
+    message = MessageTemplate.copy()
+    message["content"] = "\n\n".join(f"Item {number}:\n{item['content']}" for number, item in enumerate(messages, start=1))
+    return message
 
 
 class Judge(BaseTemplate):
@@ -10,14 +91,47 @@ class Judge(BaseTemplate):
     def __init__(
         self,
         model: Optional[str] = "deepseek-r1-1.5b-max",
-        system_message: Optional[
-            str
-        ] = """You are an assistant that receives two text snippets and must compare their semantic meaning. You will always responds in the following format:
-            - Answer, either one of those rankings: ["No semantic relation at all", "Same domain, but no matching semantical meaning", "Some matching semantical meaning", "Great match in semantical meaning", "Identical semantic meaning"]
-            - Score: a score from 1 to 5 of how semantically similar they are.
-            - Reason: a reasoning for your choice of score.
-            """,
+        system_message: Optional[str] = None,
         *,
         client_config: Optional[ClientConfig] = None,
+        max_concurrency: int = 1,
+        cache: Optional[ResponseCache] = None,
+        structured_output: bool = False,
+        batch_size: int = 1,
+        stream: bool = False,
+        stop: Optional[Sequence[str]] = None,
     ):
-        super().__init__(model, system_message, client_config=client_config)
+        """
+        Args:
+            model (Optional[str], optional): Judging model. Defaults to "deepseek-r1-1.5b-max".
+            system_message (Optional[str], optional): Defaults to `JUDGE_SYSTEM_MESSAGE`, or `JUDGE_STRUCTURED_SYSTEM_MESSAGE` for `structured_output`.
+            structured_output (bool, optional): Request the verdict as JSON (`response_format`) instead of the '- Answer/- Score/- Reason' text. The
+                backend has to support JSON schemas (vLLM, ollama >= 0.5, OpenAI). Defaults to False.
+            batch_size (int, optional): Items the `Pipeline` packs into one request (see `submit_batch`), 1 judges every item on its own. Defaults to 1.
+            stream (bool, optional): Stream the replies and close the stream as soon as the verdict is complete, so that verbose judges
+                don't keep generating text that is discarded anyway. Also fills `ChatResult.ttft`. Defaults to False.
+            stop (Optional[Sequence[str]], optional): Stop sequences of every request, e.g. ["\\n- Answer:"] against repeated verdicts. Defaults to None.
+        """
+        self.structured_output = structured_output
+        self.batch_size = max(1, batch_size)
+        if system_message is None:
+            system_message = JUDGE_STRUCTURED_SYSTEM_MESSAGE if structured_output else JUDGE_SYSTEM_MESSAGE
+
+        super().__init__(model, system_message, client_config=client_config, max_concurrency=max_concurrency, cache=cache, stream=stream)
+
+        if structured_output:
+            self.chat_params["response_format"] = JUDGE_RESPONSE_FORMAT
+        if stop:
+            self.chat_params["stop"] = list(stop)
+
+    def _stream_parser(self) -> VerdictParser:
+        # Detects the format from the reply, hence it also covers the JSON replies of `submit_batch`.
+        return VerdictParser()
+
+    def submit_batch(self, messages: List[Message], **kwargs) -> Future:
+        """Schedules one request judging all `messages` at once, the future resolves to a `ChatResult` with a JSON object of "Verdicts".
+
+        The system message is only sent once per batch. Batches always ask for JSON, `structured_output` additionally enforces its schema.
+        """
+        params = {"response_format": JUDGE_BATCH_RESPONSE_FORMAT} if self.structured_output else {}
+        return self.submit(batch_message(messages), system_message=JUDGE_BATCH_SYSTEM_MESSAGE, **{**params, **kwargs})
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from utils import ClientConfig
+from utils import ClientConfig, ResponseCache
 
 from .base import BaseTemplate
 
@@ -13,5 +13,8 @@ class Jury(BaseTemplate):
         system_message: Optional[str] = "",
         *,
         client_config: Optional[ClientConfig] = None,
+        max_concurrency: int = 1,
+        cache: Optional[ResponseCache] = None,
+        stream: bool = False,
     ):
-        super().__init__(model, system_message, client_config=client_config)
+        super().__init__(model, system_message, client_config=client_config, max_concurrency=max_concurrency, cache=cache, stream=stream)
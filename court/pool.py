@@ -0,0 +1,121 @@
+import threading
+from typing import List, Optional
+
+from openai import OpenAI
+
+from utils import ClientConfig, Endpoint
+
+from .ratelimit import RateLimiter
+
+ROUTING_POLICIES = ("least_outstanding", "latency")
+
+
+class EndpointState:
+    """Client, rate limiter and routing statistics of one endpoint of an `EndpointPool`."""
+
+    def __init__(self, endpoint: Endpoint, client: OpenAI, rate_limiter: RateLimiter):
+        self.base_url = endpoint.base_url
+        self.weight = max(endpoint.weight, 1e-6)
+        self.client = client
+        self.rate_limiter = rate_limiter
+
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        # Seconds per completion token, so that long and short replies are comparable
+        self.latency_ewma: Optional[float] = None
+
+    def score(self, routing: str, default_latency: float = 1.0) -> float:
+        """Expected cost of one more request, `default_latency` stands in for the EWMA of an endpoint that has no measurement yet."""
+        load = (self.outstanding + 1) / self.weight
+        if routing == "latency":
+            # Unmeasured endpoints are balanced by their load as well, a latency of 0 would draw every request until the first reply.
+            return (self.latency_ewma if self.latency_ewma is not None else default_latency) * load
+        return load
+
+
+class EndpointPool:
+    """Routes the requests of a `ClientConfig` across its `endpoints`, all of them serving the same models.
+
+    Every call picks the healthy endpoint with the fewest requests in flight relative to its weight ("least_outstanding"),
+    or the lowest expected latency ("latency"). Endpoints failing `max_failures` times in a row are drained and added back
+    once their `/models` route answers again. If every endpoint is drained, all of them are used as a last resort.
+
+    Args:
+        client_config (ClientConfig): Shared settings, each endpoint gets a copy with its own `base_url` and `api_key`.
+        states (List[EndpointState]): One state per endpoint, see `court.clients.get_pool`.
+        smoothing (float, optional): Weight of the newest latency within the moving average. Defaults to 0.2.
+    """
+
+    def __init__(self, client_config: ClientConfig, states: List[EndpointState], smoothing: float = 0.2):
+        if client_config.routing not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing '{client_config.routing}', expected any of {ROUTING_POLICIES}")
+
+        self.routing = client_config.routing
+        self.max_failures = max(1, client_config.max_failures)
+        self.health_check_interval = client_config.health_check_interval
+        self.endpoints = states
+        self.smoothing = smoothing
+
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def acquire(self) -> EndpointState:
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy] or self.endpoints
+            # Unmeasured endpoints are assumed to be as fast as the average of the measured ones
+            measured = [endpoint.latency_ewma for endpoint in self.endpoints if endpoint.latency_ewma is not None]
+            default_latency = sum(measured) / len(measured) if measured else 1.0
+            endpoint = min(candidates, key=lambda candidate: candidate.score(self.routing, default_latency))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(
+        self, endpoint: EndpointState, *, latency: Optional[float] = None, completion_tokens: int = 0, failed: bool = False
+    ) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+
+            if failed:
+                endpoint.failures += 1
+                if endpoint.healthy and endpoint.failures >= self.max_failures and len(self.endpoints) > 1:
+                    endpoint.healthy = False
+                    print(f"[pool] draining '{endpoint.base_url}' after {endpoint.failures} failed requests")
+                    self._start_health_checks()
+                return
+
+            endpoint.failures = 0
+            if latency is not None:
+                per_token = latency / max(1, completion_tokens)
+                ewma = endpoint.latency_ewma
+                endpoint.latency_ewma = per_token if ewma is None else (1 - self.smoothing) * ewma + self.smoothing * per_token
+
+    def _start_health_checks(self) -> None:
+        # Started with the first drained endpoint, single endpoint configs never need it.
+        if self._health_thread is None or not self._health_thread.is_alive():
+            self._health_thread = threading.Thread(target=self._check_health, name="EndpointPoolHealth", daemon=True)
+            self._health_thread.start()
+
+    def _check_health(self) -> None:
+        while not self._stopped.wait(self.health_check_interval):
+            with self._lock:
+                drained = [endpoint for endpoint in self.endpoints if not endpoint.healthy]
+            if not drained:
+                return
+
+            for endpoint in drained:
+                try:
+                    endpoint.client.with_options(timeout=self.health_check_interval).models.list()
+                except Exception:
+                    continue
+
+                with self._lock:
+                    endpoint.healthy = True
+                    endpoint.failures = 0
+                    # Measurements from before the outage are stale, until its first reply it is scored with the pool average
+                    endpoint.latency_ewma = None
+                print(f"[pool] '{endpoint.base_url}' is healthy again")
+
+    def close(self) -> None:
+        self._stopped.set()
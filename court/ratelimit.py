@@ -0,0 +1,164 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+
+class RateLimiter:
+    """Per-endpoint token bucket (requests/s and tokens/min) combined with an AIMD concurrency window.
+
+    The window grows by one slot per window of successful requests and is cut multiplicatively whenever the endpoint
+    signals overload (429/503) or the latency per generated token spikes. A `Retry-After` from the server pauses every
+    request to the endpoint until it has passed.
+
+    Args:
+        requests_per_second (Optional[float], optional): Sustained request rate. Defaults to None (unlimited).
+        tokens_per_minute (Optional[int], optional): Sustained prompt + completion token rate. Defaults to None (unlimited).
+        max_concurrency (int, optional): Upper bound of the concurrency window. Defaults to 100.
+        min_concurrency (int, optional): Lower bound of the concurrency window. Defaults to 1.
+        decrease (float, optional): Factor the window is multiplied with on overload. Defaults to 0.5.
+        latency_factor (Optional[float], optional): Latency spike threshold relative to the moving average. Defaults to 4.0.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        tokens_per_minute: Optional[int] = None,
+        *,
+        max_concurrency: int = 100,
+        min_concurrency: int = 1,
+        decrease: float = 0.5,
+        latency_factor: Optional[float] = 4.0,
+    ):
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+
+        self.limit: float = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+
+        now = time.monotonic()
+        self._condition = threading.Condition()
+        self._request_bucket = float(max(1.0, requests_per_second or 1.0))
+        self._token_bucket = float(tokens_per_minute or 0)
+        self._refilled_at = now
+        self._blocked_until = now
+        self._last_decrease = 0.0
+        self._latency_ewma: Optional[float] = None
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+
+        if self.requests_per_second:
+            self._request_bucket = min(max(1.0, self.requests_per_second), self._request_bucket + elapsed * self.requests_per_second)
+        if self.tokens_per_minute:
+            self._token_bucket = min(float(self.tokens_per_minute), self._token_bucket + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Blocks until a concurrency slot is free and both buckets can pay for the request."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                # Requests larger than the whole bucket would never fit, they only wait for a full one.
+                needed_tokens = min(tokens, self.tokens_per_minute or 0)
+
+                if now < self._blocked_until:
+                    timeout = self._blocked_until - now
+                elif self.in_flight >= int(self.limit):
+                    timeout = None
+                elif self.requests_per_second and self._request_bucket < 1.0:
+                    timeout = (1.0 - self._request_bucket) / self.requests_per_second
+                elif self.tokens_per_minute and self._token_bucket < needed_tokens:
+                    timeout = (needed_tokens - self._token_bucket) * 60 / self.tokens_per_minute
+                else:
+                    break
+
+                self._condition.wait(timeout=timeout)
+
+            self.in_flight += 1
+            if self.requests_per_second:
+                self._request_bucket -= 1.0
+            if self.tokens_per_minute:
+                self._token_bucket -= tokens
+
+    def release(
+        self,
+        *,
+        latency: Optional[float] = None,
+        completion_tokens: int = 0,
+        token_correction: int = 0,
+        throttled: bool = False,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """Frees the slot of a finished request and adapts the concurrency window.
+
+        Args:
+            latency (Optional[float], optional): Wall time of a successful request, None if the request failed. Defaults to None.
+            completion_tokens (int, optional): Generated tokens, used to normalise `latency`. Defaults to 0.
+            token_correction (int, optional): Difference between the reported and the estimated token usage. Defaults to 0.
+            throttled (bool, optional): True if the endpoint answered with 429/503. Defaults to False.
+            retry_after (Optional[float], optional): Seconds the endpoint asked us to wait. Defaults to None.
+        """
+        with self._condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+
+            if self.tokens_per_minute:
+                self._token_bucket -= token_correction
+
+            if throttled:
+                self.throttled += 1
+                self._decrease(now)
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+
+            elif latency is not None:
+                normalised = latency / (completion_tokens + 1)
+                if self.latency_factor and self._latency_ewma and normalised > self.latency_factor * self._latency_ewma:
+                    self._decrease(now)
+                else:
+                    # Additive increase: one extra slot after a full window of successful requests.
+                    self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+                self._latency_ewma = normalised if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * normalised
+
+            self._condition.notify_all()
+
+    def _decrease(self, now: float) -> None:
+        # All requests that were in flight during an overload report it, but it should only count as one congestion event.
+        if now - self._last_decrease < 1.0:
+            return
+
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Reads `retry-after-ms` / `retry-after` (seconds or HTTP date) and returns the delay in seconds."""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,119 @@
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from openai import Stream
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionChunk
+
+# The verdict is complete once the line of the last field has ended, see `pipeline.parsing.FIELD_PATTERNS`.
+TEXT_VERDICT_PATTERN = re.compile(r"- Answer:\s*\S.*?- Score:\s*\S.*?- Reason:[ \t]*\S[^\n]*\n", re.DOTALL)
+
+
+class VerdictParser:
+    """Watches the streamed reply of a judge and tells when its verdict is complete, everything after it would be discarded anyway.
+
+    The format is detected from the reply itself: a JSON object (structured or batched verdicts) is complete once its braces are
+    balanced, '- Answer/- Score/- Reason' text once the line of the reason has ended. A leading '<think> ... </think>' block is skipped.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        # Start of the verdict within the buffer, None while the reply may still be thinking
+        self._start: Optional[int] = None
+        self._json: Optional[bool] = None
+        # Scanning state of the JSON object, only new characters are looked at
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, delta: str) -> bool:
+        """Adds the next piece of the reply, returns True once the verdict is complete."""
+        self._buffer += delta
+        if self._start is None and not self._find_start():
+            return False
+
+        if self._json:
+            return self._scan_json()
+        # Only a new line can complete a text verdict
+        return "\n" in delta and TEXT_VERDICT_PATTERN.search(self._buffer, self._start) is not None
+
+    def _find_start(self) -> bool:
+        buffer = self._buffer
+        offset = 0
+        # The opening tag may arrive in pieces
+        if "<think>".startswith(buffer.lstrip()):
+            return False
+        if buffer.lstrip().startswith("<think>") or ("</think>" in buffer and "<think>" not in buffer):
+            end = buffer.find("</think>")
+            if end == -1:
+                return False
+            offset = end + len("</think>")
+
+        stripped = buffer[offset:].lstrip()
+        if not stripped:
+            return False
+        # Some backends wrap the object in a code fence
+        self._json = stripped[0] in "{`"
+        self._start = offset
+        self._scanned = offset
+        return True
+
+    def _scan_json(self) -> bool:
+        for position in range(self._scanned, len(self._buffer)):
+            char = self._buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._scanned = position + 1
+                    return True
+        self._scanned = len(self._buffer)
+        return False
+
+
+@dataclass
+class StreamedCompletion:
+    """Reply of a streamed request, `usage` is only known if the stream was read to its end."""
+
+    content: str
+    ttft: Optional[float]
+    chunks: int
+    usage: Optional[CompletionUsage] = None
+    cut_off: bool = False
+
+
+def read_stream(stream: Stream[ChatCompletionChunk], start: float, parser: Optional[VerdictParser] = None) -> StreamedCompletion:
+    """Collects the content of `stream`, closing it as soon as `parser` reports a complete verdict."""
+    parts, ttft, chunks, usage = [], None, 0, None
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(delta)
+            chunks += 1
+            if parser is not None and parser.feed(delta):
+                return StreamedCompletion(content="".join(parts), ttft=ttft, chunks=chunks, cut_off=True)
+    finally:
+        # Closing the connection is what makes the server stop generating.
+        stream.close()
+
+    return StreamedCompletion(content="".join(parts), ttft=ttft, chunks=chunks, usage=usage)
@@ -1,10 +1,11 @@
 import os
+from typing import Optional, Sequence
 
 from dotenv import load_dotenv
 
 from court import Judge, Jury
-from pipeline import Pipeline
-from utils import BalancedGenerator, ClientConfig
+from pipeline import EarlyStopping, Pipeline, PreScoring, QueueWorker, ReplyProcessing, WorkQueue
+from utils import BalancedGenerator, ClientConfig, ResponseCache
 
 from analysis import make_plots, ScoreComparison
 
@@ -18,8 +19,21 @@ API_KEY = os.environ.get("API_KEY")
 def run_queries(
     iterations: int = 5,
     questions: int = 10,
-    judge_model: str = "Llama-4-Maverick-17B-128E-Instruct-FP8",
-    jury_model: str = "Qwen3-235B-A22B-Instruct-2507-FP8",
+    judge_model: str | Sequence[str] = "Llama-4-Maverick-17B-128E-Instruct-FP8",
+    jury_model: str | Sequence[str] = "Qwen3-235B-A22B-Instruct-2507-FP8",
+    max_concurrency: int = 1,
+    cache: bool = False,
+    resume: bool = False,
+    structured_judge: bool = False,
+    judge_batch_size: int = 1,
+    stream_judge: bool = False,
+    reply_processing: Optional[str] = None,
+    reply_max_tokens: Optional[int] = None,
+    queue_path: Optional[str] = None,
+    prescore_accept_above: Optional[float] = None,
+    prescore_reject_below: Optional[float] = None,
+    min_iterations: Optional[int] = None,
+    stopping_tolerance: float = 0.0,
     **llm_params,
 ):
     """This function initiates and executes the questionaire pipeline.
@@ -27,22 +41,105 @@ def run_queries(
     Args:
         iterations (int, optional): How often the querying (of the exact same randomly chosen questions) should be repeated. Defaults to 5.
         questions (int, optional): Amount of questions to randomly choose per category. Defaults to 10.
-        judge_model (str, optional): Judging model that outputs a numerical and textual score, based on the input of the jury model and the gold standard answer. Defaults to "Llama-4-Maverick-17B-128E-Instruct-FP8".
-        jury_model (str, optional): LLM model that answers questions and generates a response. Defaults to "Qwen3-235B-A22B-Instruct-2507-FP8".
+        judge_model (str | Sequence[str], optional): Judging model that outputs a numerical and textual score, based on the input of the jury model and the gold standard answer. Several models are all used to score every jury. Defaults to "Llama-4-Maverick-17B-128E-Instruct-FP8".
+        jury_model (str | Sequence[str], optional): LLM model that answers questions and generates a response. Several models are swept in parallel over the same questions. Defaults to "Qwen3-235B-A22B-Instruct-2507-FP8".
+        max_concurrency (int, optional): Maximum amount of requests that are in flight at once per model (jury and judge each), raise it for servers that process requests in parallel. Defaults to 1 (sequential).
+        cache (bool, optional): Reuse stored replies of identical requests (see `ResponseCache`). Only the first iteration reads from the cache, the repeated ones always query the models. Defaults to False.
+        resume (bool, optional): Continue the most recent crashed run (see `RunJournal`) before the `iterations` new ones are run. Defaults to False.
+        structured_judge (bool, optional): Let the judge answer with a JSON verdict (`response_format`) instead of free text. Defaults to False.
+        judge_batch_size (int, optional): Jury replies the judge scores per request (see `Judge.submit_batch`), items of unparsable batch replies are judged one by one. Defaults to 1.
+        stream_judge (bool, optional): Stream the judge replies and stop reading once the verdict is complete (see `Judge`). Defaults to False.
+        reply_processing (Optional[str], optional): How jury replies are reduced before judging, "strip_think" or "final_answer" (see `ReplyProcessing`). Defaults to None (forward unchanged).
+        reply_max_tokens (Optional[int], optional): Truncate the forwarded jury replies to roughly this many tokens. Defaults to None.
+        queue_path (Optional[str], optional): Publish the work items of all iterations to this `WorkQueue` and wait for the workers (see `run_worker`) instead of querying the models here. Can't be combined with `judge_batch_size`, pre-scoring or early stopping. Defaults to None.
+        prescore_accept_above (Optional[float], optional): Assign the highest score without a judge call to replies whose n-gram similarity to the gold answer reaches this value (see `PreScoring`). Defaults to None.
+        prescore_reject_below (Optional[float], optional): Assign the lowest score without a judge call to replies whose similarity is below this value. Defaults to None.
+        min_iterations (Optional[int], optional): Stop repeating a question once it was queried this often and its verdicts agree (see `EarlyStopping`), the remaining iterations only repeat the unstable ones. Defaults to None (repeat every question `iterations` times).
+        stopping_tolerance (float, optional): Largest standard deviation of the scores of a question that counts as agreeing. Defaults to 0.0.
     """
 
     config = ClientConfig(BASE_URL, API_KEY)
     generator = BalancedGenerator()
     generator.generate_set(amount=questions)
 
-    jury = Jury(model=jury_model, client_config=config)
-    judge = Judge(model=judge_model, client_config=config)
-
-    pipeline = Pipeline(judge=judge, jury=jury, generator=generator)
+    response_cache = ResponseCache() if cache else None
+    juries = [
+        Jury(model=model, client_config=config, max_concurrency=max_concurrency, cache=response_cache)
+        for model in ([jury_model] if isinstance(jury_model, str) else jury_model)
+    ]
+    judges = [
+        Judge(
+            model=model,
+            client_config=config,
+            max_concurrency=max_concurrency,
+            cache=response_cache,
+            structured_output=structured_judge,
+            batch_size=judge_batch_size,
+            stream=stream_judge,
+        )
+        for model in ([judge_model] if isinstance(judge_model, str) else judge_model)
+    ]
+
+    processing = ReplyProcessing(reply_processing or "raw", reply_max_tokens) if reply_processing or reply_max_tokens else None
+    pre_scoring = (
+        PreScoring(prescore_accept_above, prescore_reject_below)
+        if prescore_accept_above is not None or prescore_reject_below is not None
+        else None
+    )
+    early_stopping = EarlyStopping(min_iterations, stopping_tolerance) if min_iterations is not None else None
+    pipeline = Pipeline(
+        judge=judges,
+        jury=juries,
+        generator=generator,
+        resume=resume or None,
+        reply_processing=processing,
+        pre_scoring=pre_scoring,
+        early_stopping=early_stopping,
+    )
+
+    if queue_path:
+        work_queue = WorkQueue(queue_path)
+        for iteration in range(iterations):
+            pipeline.publish(work_queue, bypass_cache=iteration > 0, max_completion_tokens=2048, **llm_params)
+        pipeline.collect(work_queue)
+        work_queue.close()
+        return
+
+    # Run multiple iterations for analysis, a resumed run is completed on top of them
+    for iteration in range(iterations + bool(resume)):
+        pipeline.query(bypass_cache=iteration > 0, max_completion_tokens=2048, **llm_params)
+
+    if response_cache:
+        print(f"[cache] {response_cache.stats()}")
+
+
+def run_worker(
+    queue_path: str,
+    max_concurrency: int = 8,
+    cache: bool = False,
+    reply_processing: Optional[str] = None,
+    reply_max_tokens: Optional[int] = None,
+):
+    """Processes the work items published by `run_queries(queue_path=...)`, start one per node (or more) until the queue is empty.
 
-    # Run multiple iterations for analysis
-    for _ in range(iterations):
-        pipeline.query(max_completion_tokens=2048, **llm_params)
+    Args:
+        queue_path (str): SQLite file of the `WorkQueue`, on a filesystem every worker can lock.
+        max_concurrency (int, optional): Items in flight at once. Defaults to 8.
+        cache (bool, optional): Reuse stored replies of identical requests, see `run_queries`. Defaults to False.
+        reply_processing (Optional[str], optional): Must match the `reply_processing` of the publishing run. Defaults to None.
+        reply_max_tokens (Optional[int], optional): Must match the `reply_max_tokens` of the publishing run. Defaults to None.
+    """
+    work_queue = WorkQueue(queue_path)
+    processing = ReplyProcessing(reply_processing or "raw", reply_max_tokens) if reply_processing or reply_max_tokens else None
+    worker = QueueWorker(
+        work_queue,
+        client_config=ClientConfig(BASE_URL, API_KEY),
+        max_concurrency=max_concurrency,
+        cache=ResponseCache() if cache else None,
+        reply_processing=processing,
+    )
+    print(f"[worker] completed {worker.run()} items")
+    work_queue.close()
 
 
 def run_analysis():
@@ -1,3 +1,21 @@
+from .journal import JournalEntry, RunJournal
+from .metrics import RunMetrics
+from .postprocess import ReplyProcessing
+from .prescore import PreScoring
 from .query import Pipeline
+from .stopping import EarlyStopping
+from .writer import ResultWriter
+from .workqueue import QueueWorker, WorkQueue
 
-__all__ = ["Pipeline"]
+__all__ = [
+    "Pipeline",
+    "RunJournal",
+    "JournalEntry",
+    "ReplyProcessing",
+    "PreScoring",
+    "EarlyStopping",
+    "RunMetrics",
+    "WorkQueue",
+    "QueueWorker",
+    "ResultWriter",
+]
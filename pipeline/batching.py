@@ -0,0 +1,71 @@
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from court import ChatResult
+from utils import Message
+
+
+@dataclass
+class BatchItem:
+    """A jury reply waiting for a batched judge request."""
+
+    # (jury index, judge index, DataHolder index), see `pipeline.query.PendingKey`
+    key: Tuple[int, int, int]
+    index: int
+    jury_result: ChatResult
+    message: Message
+    similarity: Optional[float] = None
+
+
+class JudgeBatcher:
+    """Collects the items of one judge until `batch_size` of them are ready, or until no further jury reply will arrive.
+
+    Every jury reply routed to the judge is announced with `expect` before its request is submitted and reported exactly once
+    afterwards, with `add` or, if it needs no judge call, with `skip`. Once `close` was called, the last partial batch is flushed
+    as soon as every announced reply has been reported.
+
+    Args:
+        batch_size (int): Items per request.
+        flush (Callable[[List[BatchItem]], None]): Submits a full (or the last) batch, called outside of the lock.
+    """
+
+    def __init__(self, batch_size: int, flush: Callable[[List[BatchItem]], None]):
+        self.batch_size = batch_size
+        self.flush = flush
+        self._expected = 0
+        self._closed = False
+        self._items: List[BatchItem] = []
+        self._lock = threading.Lock()
+
+    def expect(self) -> None:
+        with self._lock:
+            self._expected += 1
+
+    def add(self, item: BatchItem) -> None:
+        with self._lock:
+            self._items.append(item)
+            self._expected -= 1
+            batch = self._take()
+        if batch:
+            self.flush(batch)
+
+    def skip(self) -> None:
+        with self._lock:
+            self._expected -= 1
+            batch = self._take()
+        if batch:
+            self.flush(batch)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            batch = self._take()
+        if batch:
+            self.flush(batch)
+
+    def _take(self) -> List[BatchItem]:
+        if len(self._items) >= self.batch_size or (self._closed and self._expected <= 0 and self._items):
+            batch, self._items = self._items[: self.batch_size], self._items[self.batch_size :]
+            return batch
+        return []
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional, TextIO, Tuple
+
+JournalKey = Tuple[str, str, int]
+
+
+@dataclass
+class JournalEntry:
+    dataset: str
+    qtype: str
+    position: int
+    jury: str
+    judge: str
+    jury_seconds: float
+    judge_seconds: float
+    # Prompt tokens of the judge call as reported by the server, None for cache hits and journals of older runs.
+    judge_prompt_tokens: Optional[int] = None
+    # Similarity of the pre-scoring stage, and whether it assigned the score instead of the judge
+    similarity: Optional[float] = None
+    pre_scored: bool = False
+
+    @property
+    def key(self) -> JournalKey:
+        return (self.dataset, self.qtype, self.position)
+
+
+class RunJournal:
+    """Append-only log of every finished (jury, judge) pair of a run, one JSON object per line.
+
+    Each entry is flushed as soon as it is written, so a crashed run can be continued with `Pipeline(resume=...)`
+    without repeating the calls that were already paid for. Once every file of the run is written, `finish` renames the
+    journal to `FINISHED_NAME`, which keeps it for reference but takes the run out of the resumable ones.
+    """
+
+    FILE_NAME = "journal.jsonl"
+    FINISHED_NAME = "journal.finished.jsonl"
+
+    def __init__(self, run_dir: Path, fsync: bool = False):
+        self.path = Path(run_dir) / self.FILE_NAME
+        self.finished_path = Path(run_dir) / self.FINISHED_NAME
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_path.exists()
+
+    def replay(self) -> Dict[JournalKey, JournalEntry]:
+        entries: Dict[JournalKey, JournalEntry] = {}
+        if not self.path.exists():
+            return entries
+
+        with self.path.open(encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = JournalEntry(**json.loads(line))
+                except (json.JSONDecodeError, TypeError):
+                    # The last line may be cut off if the process died while writing it, that item is simply queried again.
+                    continue
+                entries[entry.key] = entry
+
+        return entries
+
+    def append(self, entry: JournalEntry) -> None:
+        line = json.dumps(asdict(entry), ensure_ascii=False) + "\n"
+
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = self.path.open("a", encoding="utf-8")
+
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def finish(self) -> None:
+        """Marks the run as complete, a run without any entry (e.g. every item stopped early) has nothing to mark."""
+        self.close()
+        if self.path.exists():
+            os.replace(self.path, self.finished_path)
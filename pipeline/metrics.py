@@ -0,0 +1,196 @@
+import json
+import math
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Collection, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from court import ChatResult
+
+METRICS_FORMATS = ("json", "prometheus")
+QUANTILES = (0.5, 0.95)
+
+
+@dataclass
+class CallMetric:
+    stage: str
+    model: str
+    dataset: str
+    qtype: str
+    seconds: float
+    ttft: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+
+class RunMetrics:
+    """Collects one `CallMetric` per jury / judge call of a `Pipeline.query` and aggregates them per stage, model and qtype.
+
+    Cached replies are counted, but left out of the latency and throughput statistics since no request was sent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: List[CallMetric] = []
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, stage: str, model: str, dataset: str, qtype: str, result: ChatResult) -> None:
+        call = CallMetric(
+            stage=stage,
+            model=model,
+            dataset=dataset,
+            qtype=qtype,
+            seconds=result.seconds,
+            ttft=result.ttft,
+            prompt_tokens=result.prompt_tokens,
+            completion_tokens=result.completion_tokens,
+            cached=result.cached,
+        )
+        with self._lock:
+            self._calls.append(call)
+
+    def record_error(self, stage: str, model: str, dataset: str, qtype: str, error: BaseException) -> None:
+        call = CallMetric(stage=stage, model=model, dataset=dataset, qtype=qtype, seconds=math.nan, error=type(error).__name__)
+        with self._lock:
+            self._calls.append(call)
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    @property
+    def wall_seconds(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def frame(self, dataset: Optional[str] = None, models: Optional[Collection[str]] = None) -> pd.DataFrame:
+        with self._lock:
+            calls = list(self._calls)
+
+        df = pd.DataFrame([asdict(call) for call in calls], columns=list(CallMetric.__dataclass_fields__))
+        if dataset is not None:
+            df = df[df["dataset"] == dataset]
+        if models is not None:
+            df = df[df["model"].isin(list(models))]
+        return df
+
+    def summary(
+        self, by: Sequence[str] = ("stage", "model"), dataset: Optional[str] = None, models: Optional[Collection[str]] = None
+    ) -> pd.DataFrame:
+        return summarize_calls(self.frame(dataset, models), self.wall_seconds, by)
+
+    def write(
+        self, path: Path, fmt: str = "json", dataset: Optional[str] = None, run: str = "", models: Optional[Collection[str]] = None
+    ) -> Path:
+        """Writes the aggregates per stage, model and qtype (plus the totals per stage and model) of `dataset` and `models` to `path`."""
+        if fmt not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format '{fmt}', expected any of {METRICS_FORMATS}")
+
+        groups = self.summary(by=("stage", "model", "qtype"), dataset=dataset, models=models)
+        totals = self.summary(by=("stage", "model"), dataset=dataset, models=models)
+
+        if fmt == "json":
+            content = json.dumps(
+                {
+                    "run": run,
+                    "dataset": dataset,
+                    "wall_seconds": self.wall_seconds,
+                    "totals": _records(totals),
+                    "groups": _records(groups),
+                },
+                indent=2,
+            )
+        else:
+            content = _prometheus(groups, {"run": run, "dataset": dataset or ""})
+
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def print_summary(self) -> None:
+        for row in self.summary().itertuples(index=False):
+            line = f"[metrics] {row.stage} '{row.model}': {row.calls} calls ({row.errors} errors, {row.cached} cached)"
+            if not math.isnan(row.latency_p50):
+                line += (
+                    f", latency p50 {row.latency_p50:.2f}s / p95 {row.latency_p95:.2f}s"
+                    f", {row.tokens_per_second_p50:.1f} / {row.tokens_per_second_p95:.1f} tokens/s (p50 / p95)"
+                    f", {row.requests_per_second:.2f} requests/s"
+                )
+            print(line)
+
+
+def summarize_calls(df: pd.DataFrame, wall_seconds: float, by: Sequence[str] = ("stage", "model")) -> pd.DataFrame:
+    """Aggregates the calls of `RunMetrics.frame` per `by`, one row per group with counts, latency / TTFT quantiles, token sums and throughput."""
+    rows: List[Dict[str, Any]] = []
+    for keys, group in df.groupby(list(by), sort=True):
+        sent = group[~group["cached"] & group["error"].isna()]
+        completion_tokens = sent["completion_tokens"].astype(float)
+        tokens_per_second = completion_tokens / sent["seconds"].where(sent["seconds"] > 0)
+
+        row: Dict[str, Any] = dict(zip(by, keys))
+        row.update(
+            calls=len(group),
+            errors=int(group["error"].notna().sum()),
+            cached=int(group["cached"].sum()),
+            prompt_tokens=int(sent["prompt_tokens"].fillna(0).sum()),
+            completion_tokens=int(completion_tokens.fillna(0).sum()),
+            seconds=float(sent["seconds"].sum()),
+            requests_per_second=len(sent) / wall_seconds if wall_seconds > 0 else math.nan,
+        )
+        for quantile in QUANTILES:
+            label = f"p{int(quantile * 100)}"
+            row[f"latency_{label}"] = sent["seconds"].quantile(quantile)
+            row[f"ttft_{label}"] = sent["ttft"].astype(float).quantile(quantile)
+            row[f"tokens_per_second_{label}"] = tokens_per_second.quantile(quantile)
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    # NaN is not valid JSON, empty statistics are written as null.
+    return [
+        {key: None if isinstance(value, float) and math.isnan(value) else value for key, value in row.items()}
+        for row in df.to_dict("records")
+    ]
+
+
+def _labels(**labels: Any) -> str:
+    escaped = {name: str(value).replace("\\", "\\\\").replace('"', '\\"') for name, value in labels.items()}
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+def _value(value: float) -> str:
+    return "NaN" if math.isnan(value) else repr(float(value))
+
+
+def _prometheus(groups: pd.DataFrame, constant_labels: Dict[str, str]) -> str:
+    """Renders the aggregates in the Prometheus text exposition format, e.g. for the node exporter's textfile collector."""
+    lines = [
+        "# HELP judgely_request_seconds Wall time of the chat requests.",
+        "# TYPE judgely_request_seconds summary",
+    ]
+    for row in groups.to_dict("records"):
+        labels = {**constant_labels, "stage": row["stage"], "model": row["model"], "qtype": row["qtype"]}
+        for quantile in QUANTILES:
+            value = row[f"latency_p{int(quantile * 100)}"]
+            lines.append(f"judgely_request_seconds{_labels(**labels, quantile=quantile)} {_value(value)}")
+        lines.append(f"judgely_request_seconds_sum{_labels(**labels)} {_value(row['seconds'])}")
+        lines.append(f"judgely_request_seconds_count{_labels(**labels)} {row['calls'] - row['cached'] - row['errors']}")
+
+    for name, column, help_text in (
+        ("judgely_requests_total", "calls", "Chat calls, including cached ones and errors."),
+        ("judgely_request_errors_total", "errors", "Chat calls that failed."),
+        ("judgely_cached_replies_total", "cached", "Chat calls answered from the response cache."),
+        ("judgely_prompt_tokens_total", "prompt_tokens", "Prompt tokens reported by the server."),
+        ("judgely_completion_tokens_total", "completion_tokens", "Completion tokens reported by the server."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for row in groups.to_dict("records"):
+            labels = {**constant_labels, "stage": row["stage"], "model": row["model"], "qtype": row["qtype"]}
+            lines.append(f"{name}{_labels(**labels)} {row[column]}")
+
+    return "\n".join(lines) + "\n"
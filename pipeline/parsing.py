@@ -0,0 +1,118 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from court import JUDGE_ANSWERS
+from utils import Message, MessageTemplate
+
+VERDICT_FIELDS: List[str] = ["Answer", "Score", "Reason"]
+PARSED_COLUMNS: List[str] = VERDICT_FIELDS + ["ParseError"]
+
+# Verbose judges tend to repeat their verdict, everything starting at a second '- Answer:' block is ignored.
+SECOND_VERDICT_PATTERN = r"\n(?=- Answer:)"
+FIELD_PATTERNS: Dict[str, str] = {field: rf"- {field}:\s*(.*)" for field in VERDICT_FIELDS}
+
+
+def build_judge_message(gold_answer: str, jury_reply: str) -> Message:
+    """The request a judge scores, the layout `parse_judge_replies` expects the verdict for."""
+    # A new message per call: the gold answers of a `DataHolder` are reused by every iteration, hence they must never be modified.
+    judge_message = MessageTemplate.copy()
+    judge_message["content"] = f"1:\n{gold_answer}\n 2:{jury_reply}"
+    return judge_message
+
+
+def format_verdict(score: int, reason: str, structured: bool = False, answer: Optional[str] = None) -> str:
+    """A single verdict in the format a judge would have replied, for scores assigned without asking it or split off a batch."""
+    verdict = {"Answer": answer if answer is not None else JUDGE_ANSWERS[score - 1], "Score": score, "Reason": reason}
+    if structured:
+        return json.dumps(verdict)
+    return "\n".join(f"- {field}: {value}" for field, value in verdict.items())
+
+
+def parse_judge_replies(replies: Sequence[str], structured: bool = False) -> pd.DataFrame:
+    """Parses all judge replies of a batch at once.
+
+    Args:
+        replies (Sequence[str]): Raw judge replies, either '- Answer/- Score/- Reason' text or JSON objects.
+        structured (bool, optional): True if the replies were requested as JSON (see `Judge(structured_output=True)`). Defaults to False.
+
+    Returns:
+        pd.DataFrame: One row per reply with the columns of `PARSED_COLUMNS`. `ParseError` describes why a field is missing, None if the reply was complete.
+    """
+    replies = pd.Series(list(replies), dtype=object).fillna("")
+
+    if structured:
+        df, errors = _parse_json(replies)
+    else:
+        processed = replies.str.strip().str.split(SECOND_VERDICT_PATTERN, n=1, regex=True).str[0]
+        df = pd.DataFrame({field: processed.str.extract(pattern, expand=False) for field, pattern in FIELD_PATTERNS.items()})
+        errors = pd.Series("", index=df.index, dtype=object)
+
+    scores = pd.to_numeric(df["Score"], errors="coerce")
+    invalid_scores = df["Score"].notna() & scores.isna()
+
+    for field in VERDICT_FIELDS:
+        errors = errors + np.where(df[field].isna(), f"missing {field}; ", "")
+    errors = errors + np.where(invalid_scores, "invalid Score: " + df["Score"].astype(str) + "; ", "")
+
+    df["Score"] = scores.astype(float)
+    df["ParseError"] = errors.str.rstrip("; ").replace("", None)
+    return df[PARSED_COLUMNS]
+
+
+def split_batch_reply(reply: str, items: int, structured: bool = False) -> List[Optional[str]]:
+    """Splits the reply of `Judge.submit_batch` into one verdict per item, in the format of a single judge reply.
+
+    Items that are missing, duplicated or incomplete are None, they have to be judged on their own.
+    """
+    content = reply.rsplit("</think>", 1)[-1]
+    start, end = content.find("{"), content.rfind("}")
+    try:
+        parsed = json.loads(content[start : end + 1]) if start != -1 else None
+    except json.JSONDecodeError:
+        parsed = None
+    verdicts = parsed.get("Verdicts") if isinstance(parsed, dict) else None
+
+    candidates: Dict[int, Dict[str, Any]] = {}
+    duplicates = set()
+    for verdict in verdicts if isinstance(verdicts, list) else []:
+        number = verdict.get("Item") if isinstance(verdict, dict) else None
+        if not isinstance(number, int) or not 1 <= number <= items:
+            continue
+        if number in candidates:
+            duplicates.add(number)
+        candidates[number] = {field: verdict.get(field) for field in VERDICT_FIELDS}
+
+    numbers = [number for number in sorted(candidates) if number not in duplicates]
+    if not numbers:
+        return [None] * items
+
+    # Validated like any other judge reply, an item only counts if its single reply would have parsed without errors.
+    parsed_items = parse_judge_replies([json.dumps(candidates[number]) for number in numbers], structured=True)
+    split: List[Optional[str]] = [None] * items
+    for number, (_, row) in zip(numbers, parsed_items.iterrows()):
+        if row["ParseError"] is None and row["Score"] == int(row["Score"]):
+            split[number - 1] = format_verdict(int(row["Score"]), str(row["Reason"]), structured, answer=str(row["Answer"]))
+    return split
+
+
+def _parse_json(replies: pd.Series) -> tuple[pd.DataFrame, pd.Series]:
+    records, errors = [], []
+    for reply in replies:
+        # Thinking models put their '<think> ... </think>' block in front, some backends wrap the object in a code fence.
+        content = reply.rsplit("</think>", 1)[-1]
+        start, end = content.find("{"), content.rfind("}")
+
+        try:
+            verdict = json.loads(content[start : end + 1]) if start != -1 else None
+        except json.JSONDecodeError as error:
+            verdict, message = None, f"invalid JSON ({error.msg}); "
+        else:
+            message = "" if isinstance(verdict, dict) else "no JSON object; "
+
+        records.append({field: verdict.get(field) for field in VERDICT_FIELDS} if isinstance(verdict, dict) else {})
+        errors.append(message)
+
+    return pd.DataFrame.from_records(records, columns=VERDICT_FIELDS), pd.Series(errors, dtype=object)
@@ -0,0 +1,55 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+THINK_PATTERN = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+FINAL_ANSWER_PATTERN = re.compile(r"\**final answer\**\s*[:\-]\**\s*", re.IGNORECASE)
+
+# Same rough estimate as the rate limiter of `BaseTemplate`, there is no tokenizer of the served models at hand.
+CHARS_PER_TOKEN = 4
+
+
+def strip_think(reply: str) -> str:
+    # Some templates only emit the closing tag, everything in front of it is reasoning as well.
+    if "</think>" in reply and "<think>" not in reply:
+        reply = reply.rsplit("</think>", 1)[-1]
+    return THINK_PATTERN.sub("", reply).strip()
+
+
+def final_answer(reply: str) -> str:
+    reply = strip_think(reply)
+    parts = FINAL_ANSWER_PATTERN.split(reply)
+    return parts[-1].strip() if len(parts) > 1 else reply
+
+
+def truncate(reply: str, max_tokens: int) -> str:
+    return reply[: max_tokens * CHARS_PER_TOKEN]
+
+
+@dataclass
+class ReplyProcessing:
+    """Post-processing of the jury replies before they are forwarded to the judge, the raw reply is still stored in the results.
+
+    Args:
+        mode (str, optional): "raw" forwards the reply unchanged, "strip_think" removes '<think> ... </think>' blocks,
+            "final_answer" additionally keeps only the text after a trailing 'Final Answer:' marker. Defaults to "strip_think".
+        max_tokens (Optional[int], optional): Truncate the processed reply to roughly this many tokens. Defaults to None.
+    """
+
+    mode: str = "strip_think"
+    max_tokens: Optional[int] = None
+
+    def __post_init__(self):
+        if self.mode not in ("raw", "strip_think", "final_answer"):
+            raise ValueError(f"Unknown reply processing mode '{self.mode}', expected 'raw', 'strip_think' or 'final_answer'")
+
+    def __call__(self, reply: str) -> str:
+        if self.mode == "strip_think":
+            reply = strip_think(reply)
+        elif self.mode == "final_answer":
+            reply = final_answer(reply)
+
+        if self.max_tokens is not None:
+            reply = truncate(reply, self.max_tokens)
+
+        return reply
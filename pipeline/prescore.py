@@ -0,0 +1,121 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from court import JUDGE_ANSWERS
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int]) -> List[str]:
+    # Whitespace is normalised and the text padded, so that word boundaries form n-grams of their own.
+    text = f" {' '.join(text.lower().split())} "
+    low, high = ngram_range
+    return [text[start : start + n] for n in range(low, high + 1) for start in range(len(text) - n + 1)]
+
+
+@dataclass
+class PreScoring:
+    """Local TF-IDF similarity of the character n-grams of a jury reply and its gold answer, computed before the judge is asked.
+
+    Every row gets its cosine similarity in the `Similarity` column. Pairs at or above `accept_above` get `accept_score`,
+    pairs below `reject_below` get `reject_score` without a judge call; these rows are marked in the `PreScored` column.
+    Leaving both thresholds at None only records the similarity, e.g. to calibrate them against the judge's scores.
+
+    Args:
+        accept_above (Optional[float], optional): Similarity from which a reply counts as identical to the gold answer. Defaults to None.
+        reject_below (Optional[float], optional): Similarity below which a reply counts as unrelated. Defaults to None.
+        accept_score (int, optional): Score of accepted replies. Defaults to the highest score.
+        reject_score (int, optional): Score of rejected replies. Defaults to 1.
+        ngram_range (Tuple[int, int], optional): Smallest and largest n-gram length. Defaults to (3, 5).
+    """
+
+    accept_above: Optional[float] = None
+    reject_below: Optional[float] = None
+    accept_score: int = len(JUDGE_ANSWERS)
+    reject_score: int = 1
+    ngram_range: Tuple[int, int] = (3, 5)
+    _vocabulary: Dict[str, int] = field(default_factory=dict, init=False, repr=False)
+    _idf: np.ndarray = field(default_factory=lambda: np.zeros(0), init=False, repr=False)
+    _unknown_idf: float = field(default=1.0, init=False, repr=False)
+
+    def __post_init__(self):
+        for score in (self.accept_score, self.reject_score):
+            if not 1 <= score <= len(JUDGE_ANSWERS):
+                raise ValueError(f"Pre-scores must be within 1 and {len(JUDGE_ANSWERS)}, got {score}")
+        if self.accept_above is not None and self.reject_below is not None and self.reject_below > self.accept_above:
+            raise ValueError(f"reject_below ({self.reject_below}) must not exceed accept_above ({self.accept_above})")
+
+    @property
+    def fitted(self) -> bool:
+        return bool(self._vocabulary)
+
+    def fit(self, documents: Sequence[str]) -> "PreScoring":
+        """Learns the n-gram vocabulary and the smoothed inverse document frequencies, usually from the gold answers of a run."""
+        vocabulary: Dict[str, int] = {}
+        doc_ids, term_ids = [], []
+        for doc_id, document in enumerate(documents):
+            for ngram in set(char_ngrams(document, self.ngram_range)):
+                term_ids.append(vocabulary.setdefault(ngram, len(vocabulary)))
+                doc_ids.append(doc_id)
+
+        document_frequency = np.bincount(np.asarray(term_ids, dtype=np.int64), minlength=len(vocabulary))
+        self._vocabulary = vocabulary
+        self._idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        # N-grams that were never seen are as rare as it gets
+        self._unknown_idf = float(np.log(1 + len(documents)) + 1)
+        return self
+
+    def similarity(self, golds: Sequence[str], replies: Sequence[str]) -> np.ndarray:
+        """Cosine similarity of every (gold, reply) pair, all pairs are weighted and compared at once.
+
+        Without a prior `fit`, the frequencies are learned from the pairs themselves.
+        """
+        if len(golds) != len(replies):
+            raise ValueError(f"Got {len(golds)} gold answers but {len(replies)} replies")
+        pairs = len(golds)
+        if not pairs:
+            return np.zeros(0)
+        if not self.fitted:
+            self.fit(list(golds) + list(replies))
+
+        # Documents 0..pairs-1 are the gold answers, pairs..2*pairs-1 the replies.
+        known = len(self._vocabulary)
+        unknown: Dict[str, int] = {}
+        doc_ids, term_ids = [], []
+        for doc_id, document in enumerate(list(golds) + list(replies)):
+            for ngram in char_ngrams(document, self.ngram_range):
+                term_id = self._vocabulary.get(ngram)
+                if term_id is None:
+                    term_id = known + unknown.setdefault(ngram, len(unknown))
+                term_ids.append(term_id)
+                doc_ids.append(doc_id)
+
+        terms_total = known + len(unknown)
+        keys, counts = np.unique(
+            np.asarray(doc_ids, dtype=np.int64) * terms_total + np.asarray(term_ids, dtype=np.int64), return_counts=True
+        )
+        docs, terms = np.divmod(keys, terms_total)
+
+        idf = np.concatenate([self._idf, np.full(len(unknown), self._unknown_idf)])
+        # Sublinear term frequency, a repeated phrase shouldn't dominate the comparison
+        weights = (1 + np.log(counts)) * idf[terms]
+        norms = np.sqrt(np.bincount(docs, weights**2, minlength=2 * pairs))
+
+        # Entries of the gold answer and the reply of the same pair that share a term make up the dot product.
+        is_reply = docs >= pairs
+        pair_terms = (docs % pairs) * terms_total + terms
+        shared, gold_index, reply_index = np.intersect1d(
+            pair_terms[~is_reply], pair_terms[is_reply], assume_unique=True, return_indices=True
+        )
+        dots = np.bincount(shared // terms_total, weights[~is_reply][gold_index] * weights[is_reply][reply_index], minlength=pairs)
+
+        denominators = norms[:pairs] * norms[pairs:]
+        return np.divide(dots, denominators, out=np.zeros(pairs), where=denominators > 0)
+
+    def verdict(self, similarity: float) -> Optional[Tuple[int, str]]:
+        """(score, reason) of a pair that doesn't need the judge, None if it does."""
+        if self.accept_above is not None and similarity >= self.accept_above:
+            return self.accept_score, f"Pre-scored: similarity {similarity:.3f} >= {self.accept_above}"
+        if self.reject_below is not None and similarity < self.reject_below:
+            return self.reject_score, f"Pre-scored: similarity {similarity:.3f} < {self.reject_below}"
+        return None
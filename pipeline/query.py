@@ -1,110 +1,720 @@
-import re
-from pathlib import Path
-from typing import List
+import queue
+import threading
+import time
+from contextlib import suppress
+from concurrent.futures import Future
 from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 import pandas as pd
 
-from court import Judge, Jury
-from utils import BASE_PATH, BalancedGenerator, DataHolder
+from court import ChatResult, Judge, Jury
+from utils import RESULTS_PATH, BalancedGenerator, DataHolder, Message, write_results
 
+from .batching import BatchItem, JudgeBatcher
+from .journal import JournalEntry, RunJournal
+from .metrics import METRICS_FORMATS, RunMetrics
+from .parsing import build_judge_message, format_verdict, parse_judge_replies, split_batch_reply
+from .prescore import PreScoring
+from .stopping import EarlyStopping
+from .writer import ResultWriter
+from .workqueue import WorkQueue
 
-class Pipeline:
+# (jury index, judge index) of a sweep, and the same plus the index of a `DataHolder` within `generator.data`
+Pair = Tuple[int, int]
+PendingKey = Tuple[int, int, int]
+# (jury index, judge index, dataset, qtype, Position) of a single item across the iterations of a pipeline
+ItemKey = Tuple[int, int, str, str, int]
 
-    def __init__(self, judge: Judge, jury: Jury, generator: BalancedGenerator):
-        self.judge = judge
-        self.jury = jury
-        self.generator = generator
-        self._run_dir_set = False
-        self._run_dir = "1"
-        self.results_path = None
 
-    def _prepare_data_for_judge(self, jury_replies: List[str], dataholder: DataHolder):
-        for index, answer in enumerate(dataholder.answers):
-            answer["content"] = f"1:\n{answer["content"]}\n 2:{jury_replies[index]}"
+class Pipeline:
+
+    def __init__(
+        self,
+        judge: Judge | Sequence[Judge],
+        jury: Jury | Sequence[Jury],
+        generator: BalancedGenerator,
+        resume: Path | str | bool | None = None,
+        results_root: Path | str = "",
+        reply_processing: Optional[Callable[[str], str]] = None,
+        metrics_format: Optional[str] = "json",
+        pre_scoring: Optional[PreScoring] = None,
+        early_stopping: Optional[EarlyStopping] = None,
+    ):
+        """
+        Args:
+            judge (Judge | Sequence[Judge]): Model(s) that score the replies of the jury. Every judge scores the replies of every jury.
+            jury (Jury | Sequence[Jury]): Model(s) that answer the questions. Several juries are swept in parallel over the same sample
+                of `generator`, each of them is written into its own `run_N` below the judge and told apart by the `JuryModel` column.
+            generator (BalancedGenerator): Source of the questions, `generate_set` must have been called.
+            resume (Path | str | bool | None, optional): Run directory of a crashed run, whose journal is replayed by the next `query` so
+                that only the missing calls are issued. `True` picks the most recently written journal of an unfinished run of this judge.
+                That `query` only completes the crashed run, every further call starts a new one. Only supported for a single jury and
+                judge. Defaults to None.
+            results_root (Path | str, optional): Directory the results are written to. Defaults to `data/results`.
+            reply_processing (Optional[Callable[[str], str]], optional): Applied to every jury reply before it is forwarded to the judge,
+                e.g. `ReplyProcessing("strip_think")`. The results keep the raw reply. Defaults to None (forward unchanged).
+            metrics_format (Optional[str], optional): Format of the per-call metrics written into every run directory, "json" or "prometheus".
+                None only prints the summary. Defaults to "json".
+            pre_scoring (Optional[PreScoring], optional): Local similarity of every (processed) jury reply and its gold answer, which
+                assigns the score of clear matches and mismatches without a judge call. Defaults to None (every reply is judged).
+            early_stopping (Optional[EarlyStopping], optional): Skip items whose verdicts converged over the previous `query` calls of this
+                pipeline, their run files then only hold the remaining items. Defaults to None (every item is queried every time).
+        """
+        self.judges: List[Judge] = [judge] if isinstance(judge, Judge) else list(judge)
+        self.juries: List[Jury] = [jury] if isinstance(jury, Jury) else list(jury)
+        if not self.judges or not self.juries:
+            raise ValueError("A pipeline needs at least one judge and one jury")
 
-    def _get_next_run_directory(self, results_path: Path) -> Path:
-        if not results_path.exists():
-            results_path.mkdir(parents=True)
+        # The first (usually the only) models, kept for the single model API
+        self.judge = self.judges[0]
+        self.jury = self.juries[0]
+        self.generator = generator
+        self.resume = resume
+        self._check_resume()
+        self.results_root = Path(results_root) if results_root else RESULTS_PATH
+        self.reply_processing = reply_processing
+        if metrics_format is not None and metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format '{metrics_format}', expected any of {METRICS_FORMATS}")
+        self.metrics_format = metrics_format
+        self.pre_scoring = pre_scoring
+        self.early_stopping = early_stopping
+        # Scores and textual answers of every item over the `query` calls so far, the basis of `early_stopping` and the `Iteration` column
+        self._history: Dict[ItemKey, Tuple[List[float], List[Optional[str]]]] = {}
+        # Times every item was handed to a `WorkQueue` by `publish`, counted into the `Iteration` column as well
+        self._published: Dict[ItemKey, int] = {}
+        # Metrics of the most recent `query`
+        self.metrics: RunMetrics | None = None
+        self._cancelled = threading.Event()
+        # All runs of a pipeline share the date directory of its first run
+        self._date: str | None = None
 
-        run_dirs = [directory for directory in results_path.iterdir() if directory.is_dir() and directory.name.startswith("run_")]
+    def _prepare_data_for_judge(self, jury_reply: str, dataholder: DataHolder, index: int) -> Message:
+        return build_judge_message(dataholder.answers[index]["content"], jury_reply)
 
-        # If we have no directories / never started a run
-        if not run_dirs:
-            self._run_dir_set = True
-            return results_path / f"run_{self._run_dir}"
+    def _get_next_run_number(self, results_paths: List[Path]) -> int:
+        # The run number is shared by all datasets of a query, so that one `run_N` holds the same iteration everywhere.
+        run_numbers = [0]
+        for results_path in results_paths:
+            if not results_path.exists():
+                continue
 
-        if not self._run_dir_set:
-            run_numbers = []
-            for run in run_dirs:
+            for run in results_path.iterdir():
+                if not (run.is_dir() and run.name.startswith("run_")):
+                    continue
                 try:
-                    number = int(run.name.split("_")[1])
-                    run_numbers.append(number)
+                    run_numbers.append(int(run.name.split("_")[1]))
                 except (IndexError, ValueError):
                     # Ignore all directories that don't follow the run_XYZ schema, where XYZ is any arbitrary number
                     print(f"Couldn't correctly find the 'number' for: {run.name}. Skipping...")
                     continue
 
-            self._run_dir = str(max(run_numbers) + 1)
-            self._run_dir_set = True
+        return max(run_numbers) + 1
+
+    def _convert_replies_into_dataframe(
+        self, judge_replies: List[str], jury_replies: List[str], structured_output: Optional[bool] = None
+    ) -> pd.DataFrame:
+        structured_output = self.judge.structured_output if structured_output is None else structured_output
+        df = parse_judge_replies(judge_replies, structured=structured_output)
+        df["Jury"] = jury_replies
+        return df
 
-        return results_path / f"run_{self._run_dir}"
+    def _dataset_path(self, dataset_name: str, judge: Optional[Judge] = None) -> Path:
+        return self.results_root / (judge or self.judge).model / dataset_name
 
-    def _convert_replies_into_dataframe(self, judge_replies: List[str], jury_replies: List[str]) -> pd.DataFrame:
+    def _check_resume(self) -> None:
+        # The journals of a run don't record its jury, hence the runs of a sweep can't be told apart when resuming.
+        if self.resume and len(self.judges) * len(self.juries) > 1:
+            raise ValueError(
+                f"Only runs of a single jury and judge can be resumed, this pipeline sweeps {len(self.juries)} juries and {len(self.judges)} judges. "
+                "Resume every crashed run with a pipeline of its own jury and judge instead."
+            )
 
-        dfs: List[pd.DataFrame] = []
-        for index, raw_reply in enumerate(judge_replies):
+    def _find_resume_directory(self, dataset_names: List[str]) -> Path:
+        if self.resume is not True:
+            return Path(self.resume)
 
-            processed = re.split(r"\n(?=- Answer:)", raw_reply.strip())[0]
+        journals = [journal for name in dataset_names for journal in self._dataset_path(name).glob(f"*/run_*/{RunJournal.FILE_NAME}")]
+        if not journals:
+            raise FileNotFoundError(f"There is no unfinished run to resume within '{self.results_root / self.judge.model}'")
 
-            answer_match = re.search(r"- Answer:\s*(.*)", processed)
-            score_match = re.search(r"- Score:\s*(.*)", processed)
-            reason_match = re.search(r"- Reason:\s*(.*)", processed)
-            # Parse each entry into a dictionary
+        return max(journals, key=lambda journal: journal.stat().st_mtime).parent
 
-            data = [
-                {
-                    "Answer": answer_match.group(1) if answer_match else None,
-                    "Score": float(score_match.group(1)) if score_match else None,
-                    "Reason": reason_match.group(1) if reason_match else None,
-                    "Jury": jury_replies[index],
-                }
-            ]
+    def _start_run(self) -> Dict[Pair, Dict[str, Path]]:
+        dataset_names = list(dict.fromkeys(dataholder.dataset_name for dataholder in self.generator.data))
 
-            dfs.append(pd.DataFrame(data=data))
+        if self.resume:
+            # `resume` may also be set after construction, e.g. to continue a run that crashed in an earlier `query`
+            self._check_resume()
+            run_dir = self._find_resume_directory(dataset_names)
+            # Only the first `query` continues the crashed run, the following ones start new runs next to it.
+            self.resume = None
+            self._date, run_name = run_dir.parent.name, run_dir.name
+            run_dirs = {(0, 0): {name: self._dataset_path(name) / self._date / run_name for name in dataset_names}}
+            # All journals of a run are finished together, resuming a complete run would only overwrite its files.
+            if any(RunJournal(run_dir).finished for run_dir in run_dirs[(0, 0)].values()):
+                raise ValueError(f"'{run_name}' of '{self._date}' already finished, there is nothing to resume")
+            print(f"Resuming '{run_name}' of '{self._date}'")
+        else:
+            if self._date is None:
+                self._date = datetime.now().strftime("%Y-%b-%d-%Hh")
 
-        return pd.concat(dfs, ignore_index=True)
+            run_dirs = {}
+            for judge_index, judge in enumerate(self.judges):
+                # Every jury of a sweep gets its own run number below the judge, consecutive within one `query`.
+                first_run = self._get_next_run_number([self._dataset_path(name, judge) / self._date for name in dataset_names])
+                for jury_index in range(len(self.juries)):
+                    run_name = f"run_{first_run + jury_index}"
+                    run_dirs[(jury_index, judge_index)] = {
+                        name: self._dataset_path(name, judge) / self._date / run_name for name in dataset_names
+                    }
 
-    def _save_results(self, df: pd.DataFrame, dataholder: DataHolder) -> None:
-        dt = datetime.now()
-        formatted_date = dt.strftime("%Y-%b-%d-%Hh")
+        for pair_dirs in run_dirs.values():
+            for run_dir in pair_dirs.values():
+                run_dir.mkdir(exist_ok=True, parents=True)
 
-        if self.results_path is None:
-            self.results_path = BASE_PATH / "data" / "results" / self.judge.model / dataholder.dataset_name / formatted_date
+        return run_dirs
 
-        run_dir = self._get_next_run_directory(results_path=self.results_path)
-        run_dir.mkdir(exist_ok=True, parents=True)
+    def _results_frame(self, entries: List[JournalEntry], jury_model: str, structured_output: bool) -> pd.DataFrame:
+        df: pd.DataFrame = self._convert_replies_into_dataframe(
+            judge_replies=[entry.judge for entry in entries],
+            jury_replies=[entry.jury for entry in entries],
+            structured_output=structured_output,
+        )
+        df["JuryModel"] = jury_model
+        df["JurySeconds"] = [entry.jury_seconds for entry in entries]
+        df["JudgeSeconds"] = [entry.judge_seconds for entry in entries]
+        df["JudgeInputTokens"] = pd.array([entry.judge_prompt_tokens for entry in entries], dtype="Int64")
+        df["Similarity"] = [entry.similarity for entry in entries]
+        df["PreScored"] = [entry.pre_scored for entry in entries]
+        return df
 
-        output_file = f"{run_dir}/{dataholder.qtype}.csv"
-        df.index = dataholder.indices
+    def _save_results(
+        self,
+        df: pd.DataFrame,
+        dataholder: DataHolder,
+        run_dir: Path,
+        positions: Optional[Sequence[int]] = None,
+        writer: Optional[ResultWriter] = None,
+    ) -> None:
+        df.index = dataholder.indices if positions is None else positions
         df.index.name = "Position"
-        df.to_csv(output_file)
+        if writer is not None:
+            writer.submit(df, run_dir / f"{dataholder.qtype}.parquet")
+        else:
+            write_results(df, run_dir / f"{dataholder.qtype}.parquet")
+
+    def _on_jury_reply(
+        self,
+        future: Future,
+        jury_index: int,
+        judge_indices: List[int],
+        dataholder_index: int,
+        index: int,
+        replies: queue.Queue,
+        journals: Dict[Pair, Dict[str, RunJournal]],
+        metrics: RunMetrics,
+        bypass_cache: bool,
+        batchers: Dict[int, JudgeBatcher],
+    ) -> None:
+        # Runs on the jury's worker thread: every reply is forwarded to the judges on its own, without waiting for the rest of the qtype.
+        if self._cancelled.is_set():
+            return
+
+        jury = self.juries[jury_index]
+        dataholder = self.generator.data[dataholder_index]
+        try:
+            jury_result: ChatResult = future.result()
+        except Exception as error:
+            metrics.record_error("jury", jury.model, dataholder.dataset_name, dataholder.qtype, error)
+            replies.put(((jury_index, judge_indices[0], dataholder_index), index, error))
+            return
+        metrics.record("jury", jury.model, dataholder.dataset_name, dataholder.qtype, jury_result)
+
+        similarity, verdict = None, None
+        try:
+            # Reasoning traces of thinking models would otherwise make up most of the judge's prompt.
+            jury_reply = self.reply_processing(jury_result.content) if self.reply_processing else jury_result.content
+            if self.pre_scoring is not None:
+                similarity = float(self.pre_scoring.similarity([dataholder.answers[index]["content"]], [jury_reply])[0])
+                verdict = self.pre_scoring.verdict(similarity)
+        except Exception as error:
+            replies.put(((jury_index, judge_indices[0], dataholder_index), index, error))
+            return
+
+        for judge_index in judge_indices:
+            key = (jury_index, judge_index, dataholder_index)
+            batcher = batchers.get(judge_index)
+            if verdict is not None:
+                # Clear match or mismatch, the score is assigned here and the judge is never asked.
+                score, reason = verdict
+                judge_result = ChatResult(content=format_verdict(score, reason, self.judges[judge_index].structured_output), seconds=0.0)
+                self._record_entry(key, index, jury_result, judge_result, replies, journals, similarity=similarity, pre_scored=True)
+                if batcher is not None:
+                    batcher.skip()
+                continue
+
+            try:
+                judge_message = self._prepare_data_for_judge(jury_reply=jury_reply, dataholder=dataholder, index=index)
+                if batcher is not None:
+                    batcher.add(BatchItem(key=key, index=index, jury_result=jury_result, message=judge_message, similarity=similarity))
+                    continue
+                judge_future = self.judges[judge_index].submit(judge_message, bypass_cache=bypass_cache)
+            except Exception as error:
+                replies.put((key, index, error))
+                return
+
+            judge_future.add_done_callback(
+                partial(
+                    self._on_judge_reply,
+                    key=key,
+                    index=index,
+                    jury_result=jury_result,
+                    replies=replies,
+                    journals=journals,
+                    metrics=metrics,
+                    similarity=similarity,
+                )
+            )
+
+    def _on_judge_reply(
+        self,
+        future: Future,
+        key: PendingKey,
+        index: int,
+        jury_result: ChatResult,
+        replies: queue.Queue,
+        journals: Dict[Pair, Dict[str, RunJournal]],
+        metrics: RunMetrics,
+        similarity: Optional[float] = None,
+    ) -> None:
+        jury_index, judge_index, dataholder_index = key
+        judge = self.judges[judge_index]
+        dataholder = self.generator.data[dataholder_index]
+
+        try:
+            judge_result: ChatResult = future.result()
+        except Exception as error:
+            metrics.record_error("judge", judge.model, dataholder.dataset_name, dataholder.qtype, error)
+            replies.put((key, index, error))
+            return
+        metrics.record("judge", judge.model, dataholder.dataset_name, dataholder.qtype, judge_result)
+        self._record_entry(key, index, jury_result, judge_result, replies, journals, similarity=similarity)
+
+    def _converged(self, item: ItemKey) -> bool:
+        if self.early_stopping is None or item not in self._history:
+            return False
+        return self.early_stopping.converged(*self._history[item])
+
+    def _record_iteration(self, df: pd.DataFrame, pair: Pair, dataholder: DataHolder, positions: Sequence[int]) -> None:
+        # Numbered per item, an item that converged early simply has no rows in the later runs.
+        iterations = []
+        for position, score, answer in zip(positions, df["Score"], df["Answer"]):
+            item = (*pair, dataholder.dataset_name, dataholder.qtype, int(position))
+            scores, answers = self._history.setdefault(item, ([], []))
+            scores.append(score)
+            answers.append(None if pd.isna(answer) else str(answer))
+            iterations.append(len(scores) + self._published.get(item, 0))
+        df["Iteration"] = iterations
+
+    def _submit_judge_batch(
+        self,
+        items: List[BatchItem],
+        judge_index: int,
+        replies: queue.Queue,
+        journals: Dict[Pair, Dict[str, RunJournal]],
+        metrics: RunMetrics,
+        bypass_cache: bool,
+    ) -> None:
+        if self._cancelled.is_set():
+            return
+
+        judge = self.judges[judge_index]
+        if len(items) == 1:
+            # The rest of a run may leave a single item, which is judged like in the unbatched mode.
+            item = items[0]
+            judge_future = judge.submit(item.message, bypass_cache=bypass_cache)
+            judge_future.add_done_callback(
+                partial(
+                    self._on_judge_reply,
+                    key=item.key,
+                    index=item.index,
+                    jury_result=item.jury_result,
+                    replies=replies,
+                    journals=journals,
+                    metrics=metrics,
+                    similarity=item.similarity,
+                )
+            )
+            return
+
+        judge_future = judge.submit_batch([item.message for item in items], bypass_cache=bypass_cache)
+        judge_future.add_done_callback(
+            partial(
+                self._on_judge_batch_reply,
+                items=items,
+                judge_index=judge_index,
+                replies=replies,
+                journals=journals,
+                metrics=metrics,
+                bypass_cache=bypass_cache,
+            )
+        )
+
+    def _on_judge_batch_reply(
+        self,
+        future: Future,
+        items: List[BatchItem],
+        judge_index: int,
+        replies: queue.Queue,
+        journals: Dict[Pair, Dict[str, RunJournal]],
+        metrics: RunMetrics,
+        bypass_cache: bool,
+    ) -> None:
+        judge = self.judges[judge_index]
+        # A batch may span several qtypes, its call is accounted to the first one.
+        dataholder = self.generator.data[items[0].key[2]]
+
+        try:
+            batch_result: ChatResult = future.result()
+        except Exception as error:
+            metrics.record_error("judge", judge.model, dataholder.dataset_name, dataholder.qtype, error)
+            replies.put((items[0].key, items[0].index, error))
+            return
+        metrics.record("judge", judge.model, dataholder.dataset_name, dataholder.qtype, batch_result)
+
+        verdicts = split_batch_reply(batch_result.content, len(items), structured=judge.structured_output)
+        failed = [item for item, verdict in zip(items, verdicts) if verdict is None]
+        if failed:
+            print(f"[{judge.model}] {len(failed)} of {len(items)} batched verdicts could not be parsed, judging them one by one")
+
+        # Every item waited for the whole batch, the reported tokens are split evenly among them.
+        def share(tokens: Optional[int]) -> Optional[int]:
+            return tokens // len(items) if tokens is not None else None
 
-    def query(self, **kwargs):
-        self._run_dir_set = False
+        for item, verdict in zip(items, verdicts):
+            if verdict is None:
+                continue
+            judge_result = ChatResult(
+                content=verdict,
+                seconds=batch_result.seconds,
+                cached=batch_result.cached,
+                prompt_tokens=share(batch_result.prompt_tokens),
+                completion_tokens=share(batch_result.completion_tokens),
+            )
+            self._record_entry(item.key, item.index, item.jury_result, judge_result, replies, journals, similarity=item.similarity)
 
+        for item in failed:
+            try:
+                judge_future = judge.submit(item.message, bypass_cache=bypass_cache)
+            except Exception as error:
+                replies.put((item.key, item.index, error))
+                return
+            judge_future.add_done_callback(
+                partial(
+                    self._on_judge_reply,
+                    key=item.key,
+                    index=item.index,
+                    jury_result=item.jury_result,
+                    replies=replies,
+                    journals=journals,
+                    metrics=metrics,
+                    similarity=item.similarity,
+                )
+            )
+
+    def _record_entry(
+        self,
+        key: PendingKey,
+        index: int,
+        jury_result: ChatResult,
+        judge_result: ChatResult,
+        replies: queue.Queue,
+        journals: Dict[Pair, Dict[str, RunJournal]],
+        similarity: Optional[float] = None,
+        pre_scored: bool = False,
+    ) -> None:
+        jury_index, judge_index, dataholder_index = key
+        dataholder = self.generator.data[dataholder_index]
+        try:
+            entry = JournalEntry(
+                dataset=dataholder.dataset_name,
+                qtype=dataholder.qtype,
+                position=int(dataholder.indices[index]),
+                jury=jury_result.content,
+                judge=judge_result.content,
+                jury_seconds=jury_result.seconds,
+                judge_seconds=judge_result.seconds,
+                judge_prompt_tokens=judge_result.prompt_tokens,
+                similarity=similarity,
+                pre_scored=pre_scored,
+            )
+            journals[(jury_index, judge_index)][dataholder.dataset_name].append(entry)
+        except Exception as error:
+            replies.put((key, index, error))
+            return
+
+        replies.put((key, index, entry))
+
+    def query(self, bypass_cache: bool = False, **kwargs):
+        self._cancelled.clear()
+        if not self.generator.data:
+            return
+
+        run_dirs = self._start_run()
+        if self.pre_scoring is not None:
+            # The n-gram frequencies are learned from the gold answers of the sample, before the first reply arrives.
+            self.pre_scoring.fit([answer["content"] for dataholder in self.generator.data for answer in dataholder.answers])
+        metrics = self.metrics = RunMetrics()
+        journals = {pair: {name: RunJournal(run_dir) for name, run_dir in pair_dirs.items()} for pair, pair_dirs in run_dirs.items()}
+        completed = {
+            (pair, *key): entry
+            for pair, pair_journals in journals.items()
+            for journal in pair_journals.values()
+            for key, entry in journal.replay().items()
+        }
+
+        # Stage 1 (jury) and stage 2 (judge) are chained per question, stage 3 (parsing and saving) consumes `replies` on this thread.
+        replies: queue.Queue = queue.Queue()
+        pending: Dict[PendingKey, List[JournalEntry | None]] = {}
+        remaining: Dict[PendingKey, int] = {}
+        jury_futures: List[Future] = []
+        # Parsing stays on this thread, encoding and writing the files happens on the writer's.
+        writer = ResultWriter()
+        skipped = 0
+        # Judges with a `batch_size` collect the replies of all juries and qtypes into shared requests.
+        batchers = {
+            judge_index: JudgeBatcher(
+                judge.batch_size,
+                partial(
+                    self._submit_judge_batch,
+                    judge_index=judge_index,
+                    replies=replies,
+                    journals=journals,
+                    metrics=metrics,
+                    bypass_cache=bypass_cache,
+                ),
+            )
+            for judge_index, judge in enumerate(self.judges)
+            if judge.batch_size > 1
+        }
+
+        for dataholder_index, dataholder in enumerate(self.generator.data):
+            if not dataholder.questions:
+                continue
+
+            for jury_index, judge_index in run_dirs:
+                pending[(jury_index, judge_index, dataholder_index)] = [None] * len(dataholder.questions)
+                remaining[(jury_index, judge_index, dataholder_index)] = len(dataholder.questions)
+
+            for index, question in enumerate(dataholder.questions):
+                position = int(dataholder.indices[index])
+
+                # Interleaved across the juries, so that every backend has requests queued from the start of the sweep.
+                for jury_index, jury in enumerate(self.juries):
+                    judge_indices = []
+                    for judge_index in range(len(self.judges)):
+                        if self._converged((jury_index, judge_index, dataholder.dataset_name, dataholder.qtype, position)):
+                            # Its slot stays empty and is left out of this run's file.
+                            remaining[(jury_index, judge_index, dataholder_index)] -= 1
+                            skipped += 1
+                            continue
+
+                        # Items that already finished before a crash are replayed from the journal instead of being queried again.
+                        entry = completed.get(((jury_index, judge_index), dataholder.dataset_name, dataholder.qtype, position))
+                        if entry is not None:
+                            replies.put(((jury_index, judge_index, dataholder_index), index, entry))
+                        else:
+                            judge_indices.append(judge_index)
+
+                    if not judge_indices:
+                        continue
+                    for judge_index in judge_indices:
+                        if judge_index in batchers:
+                            batchers[judge_index].expect()
+
+                    jury_future = jury.submit(question, bypass_cache=bypass_cache, **kwargs)
+                    jury_futures.append(jury_future)
+                    jury_future.add_done_callback(
+                        partial(
+                            self._on_jury_reply,
+                            jury_index=jury_index,
+                            judge_indices=judge_indices,
+                            dataholder_index=dataholder_index,
+                            index=index,
+                            replies=replies,
+                            journals=journals,
+                            metrics=metrics,
+                            bypass_cache=bypass_cache,
+                            batchers=batchers,
+                        )
+                    )
+
+        # Every jury request is submitted, the batchers may send their last partial batches.
+        for batcher in batchers.values():
+            batcher.close()
+
+        if skipped:
+            print(f"[early stopping] skipping {skipped} of {skipped + sum(remaining.values())} converged items")
+        # Qtypes without any unstable item get no file in this run.
+        for key in [key for key, count in remaining.items() if count == 0]:
+            del remaining[key], pending[key]
+
+        try:
+            while remaining:
+                key, index, entry = replies.get()
+                if isinstance(entry, BaseException):
+                    raise entry
+
+                pending[key][index] = entry
+
+                remaining[key] -= 1
+                if remaining[key]:
+                    continue
+
+                # The qtype is complete for this jury and judge, hand it to the writer and release its buffers.
+                jury_index, judge_index, dataholder_index = key
+                dataholder = self.generator.data[dataholder_index]
+                indices = [index for index, entry in enumerate(pending[key]) if entry is not None]
+                positions = [int(dataholder.indices[index]) for index in indices]
+                df = self._results_frame(
+                    [pending[key][index] for index in indices], self.juries[jury_index].model, self.judges[judge_index].structured_output
+                )
+                self._record_iteration(df, (jury_index, judge_index), dataholder, positions)
+                self._save_results(
+                    df=df,
+                    dataholder=dataholder,
+                    run_dir=run_dirs[(jury_index, judge_index)][dataholder.dataset_name],
+                    positions=positions,
+                    writer=writer,
+                )
+
+                del remaining[key], pending[key]
+
+            # The run only counts as finished once every file is on disk, from then on it can't be resumed anymore.
+            writer.close()
+            for pair_journals in journals.values():
+                for journal in pair_journals.values():
+                    journal.finish()
+        except BaseException:
+            # Don't keep paying for requests of a run that failed, everything finished so far is kept in the journal.
+            self._cancelled.set()
+            for jury_future in jury_futures:
+                jury_future.cancel()
+            # The qtypes completed before the failure are still written, the original error is the one reported.
+            with suppress(BaseException):
+                writer.close()
+            raise
+        finally:
+            for pair_journals in journals.values():
+                for journal in pair_journals.values():
+                    journal.close()
+            self._write_metrics(metrics, run_dirs)
+
+    def publish(self, work_queue: WorkQueue, bypass_cache: bool = False, **kwargs) -> Dict[Pair, Dict[str, Path]]:
+        """Publishes one work item per jury, judge and question of a new run to `work_queue` instead of querying the models here.
+
+        Items are processed by `QueueWorker`s, possibly on other machines, and written into the returned run directories by
+        `collect`. Every call publishes a new run, like every `query` call does. The models are configured on the workers as
+        they are here, but judge batches, pre-scoring and early stopping span several items and are therefore rejected.
+        """
+        # A worker only ever sees a single item, rather fail than run without the options the caller asked for.
+        unsupported = [f"the batch_size of judge '{judge.model}'" for judge in self.judges if judge.batch_size > 1]
+        unsupported += [
+            name for name, option in (("pre_scoring", self.pre_scoring), ("early_stopping", self.early_stopping)) if option is not None
+        ]
+        if unsupported:
+            raise ValueError(f"Work queues don't support {', '.join(unsupported)}, use `query` instead")
+
+        run_dirs = self._start_run()
+        items = []
         for dataholder in self.generator.data:
+            for index, question in enumerate(dataholder.questions):
+                position = int(dataholder.indices[index])
+                for (jury_index, judge_index), pair_dirs in run_dirs.items():
+                    run_dir = pair_dirs[dataholder.dataset_name]
+                    jury, judge = self.juries[jury_index], self.judges[judge_index]
+                    item = (jury_index, judge_index, dataholder.dataset_name, dataholder.qtype, position)
+                    self._published[item] = self._published.get(item, 0) + 1
+                    payload = {
+                        "run_dir": str(run_dir),
+                        "dataset": dataholder.dataset_name,
+                        "qtype": dataholder.qtype,
+                        "position": position,
+                        "index": index,
+                        "iteration": len(self._history.get(item, ((), ()))[0]) + self._published[item],
+                        "jury": jury.model,
+                        "judge": judge.model,
+                        "structured_output": judge.structured_output,
+                        # Everything the workers need to create the same models, see `QueueWorker`
+                        "jury_options": {"system_message": jury.system_message, "stream": jury.stream},
+                        "judge_options": {
+                            "system_message": judge.system_message,
+                            "structured_output": judge.structured_output,
+                            "stream": judge.stream,
+                            "stop": judge.chat_params.get("stop"),
+                        },
+                        "question": question,
+                        "gold": dataholder.answers[index]["content"],
+                        "chat_params": kwargs,
+                        "bypass_cache": bypass_cache,
+                    }
+                    # Unique per item of this run, the run directory already names judge, dataset and iteration.
+                    key = f"{run_dir.relative_to(self.results_root)}/{dataholder.qtype}/{position}"
+                    items.append((key, str(run_dir / dataholder.qtype), payload))
 
-            jury_replies = []
-            for question in dataholder.questions:
-                jury_replies.append(self.jury.chat(question, **kwargs))
+        published = work_queue.publish(items)
+        print(f"[queue] published {published} of {len(items)} items to '{work_queue.path}'")
+        return run_dirs
+
+    def collect(self, work_queue: WorkQueue, wait: bool = True, poll_interval: float = 5.0) -> int:
+        """Writes every qtype whose items are all completed into its run directory, as `query` would have. Returns the amount of files written.
+
+        Qtypes that were already written are skipped, so `collect` can be called repeatedly while the workers are running. With
+        `wait` it returns once no item is pending or leased anymore.
+        """
+        written = 0
+        while True:
+            # Counted before the groups are written, items completing meanwhile are picked up by the next pass.
+            counts = work_queue.counts()
+            groups = work_queue.groups()
+            for group, states in groups.items():
+                # Not `with_suffix`, qtypes may contain dots
+                output = Path(f"{group}.parquet")
+                if states["pending"] or states["leased"] or states["failed"] or output.exists():
+                    continue
 
-            self._prepare_data_for_judge(jury_replies=jury_replies, dataholder=dataholder)
+                results = work_queue.results(group)
+                # Ordered like the questions of the `DataHolder`, independent of which worker finished first.
+                results.sort(key=lambda item: item[0]["index"])
+                entries = [JournalEntry(**result) for _, result in results]
+                payload = results[0][0]
+                df = self._results_frame(entries, payload["jury"], payload["structured_output"])
+                df["Iteration"] = pd.array([item[0].get("iteration") for item in results], dtype="Int64")
+                df.index = pd.Index([item[0]["position"] for item in results], name="Position")
+                write_results(df, output)
+                written += 1
 
-            judge_replies = []
-            for answer in dataholder.answers:
-                judge_replies.append(self.judge.chat(answer))
+            if not wait or (counts["pending"] == 0 and counts["leased"] == 0):
+                break
+            time.sleep(poll_interval)
 
-            df: pd.DataFrame = self._convert_replies_into_dataframe(judge_replies=judge_replies, jury_replies=jury_replies)
+        if counts["failed"]:
+            raise RuntimeError(
+                f"[queue] {counts['failed']} items failed, their qtypes were not written (see the 'error' column of '{work_queue.path}')"
+            )
+        return written
 
-            self._save_results(df=df, dataholder=dataholder)
+    def _write_metrics(self, metrics: RunMetrics, run_dirs: Dict[Pair, Dict[str, Path]]) -> None:
+        metrics.finish()
+        if self.metrics_format is not None:
+            suffix = "json" if self.metrics_format == "json" else "prom"
+            for (jury_index, judge_index), pair_dirs in run_dirs.items():
+                models = (self.juries[jury_index].model, self.judges[judge_index].model)
+                for dataset_name, run_dir in pair_dirs.items():
+                    metrics.write(
+                        run_dir / f"metrics.{suffix}", fmt=self.metrics_format, dataset=dataset_name, run=run_dir.name, models=models
+                    )
+        metrics.print_summary()
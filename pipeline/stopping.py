@@ -0,0 +1,38 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+
+@dataclass
+class EarlyStopping:
+    """Stops repeating items whose verdicts have settled, so that the iterations of a `Pipeline` focus on the unstable ones.
+
+    An item is one (jury, judge, dataset, qtype, Position). After `min_iterations` queries it is skipped by the following
+    `query` calls if the standard deviation of its scores is within `tolerance` and, with `agreement`, the judge gave the same
+    textual answer every time. Items with a missing score never converge.
+
+    Args:
+        min_iterations (int, optional): Queries every item gets before it may be skipped. Defaults to 3.
+        tolerance (float, optional): Largest standard deviation of the scores that counts as converged. Defaults to 0.0.
+        agreement (bool, optional): Additionally require the same textual answer in every iteration. Defaults to True.
+    """
+
+    min_iterations: int = 3
+    tolerance: float = 0.0
+    agreement: bool = True
+
+    def __post_init__(self):
+        if self.min_iterations < 1:
+            raise ValueError(f"min_iterations must be at least 1, got {self.min_iterations}")
+        if self.tolerance < 0:
+            raise ValueError(f"tolerance must not be negative, got {self.tolerance}")
+
+    def converged(self, scores: List[float], answers: List[Optional[str]]) -> bool:
+        if len(scores) < self.min_iterations:
+            return False
+
+        values = np.asarray(scores, dtype=float)
+        if np.isnan(values).any() or values.std() > self.tolerance:
+            return False
+        return not self.agreement or (None not in answers and len(set(answers)) == 1)
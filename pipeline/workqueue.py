@@ -0,0 +1,316 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from court import ChatResult, Judge, Jury
+from utils import ClientConfig, ResponseCache
+
+from .journal import JournalEntry
+from .parsing import build_judge_message
+
+ITEM_STATES = ("pending", "leased", "done", "failed")
+
+
+@dataclass
+class WorkItem:
+    """One (jury, judge) evaluation of a question, `group` is the result file it belongs to (`<run_dir>/<qtype>`)."""
+
+    id: int
+    key: str
+    group: str
+    payload: Dict[str, Any]
+    attempts: int
+
+
+class WorkQueue:
+    """Durable queue of work items in a SQLite file, shared by the publishing `Pipeline` and any number of `QueueWorker`s.
+
+    Workers lease items for `lease_timeout` seconds. Items of a worker that died become available again once their lease has
+    expired, an item whose lease expired `max_attempts` times is marked as failed instead. Inserting and completing are
+    idempotent: an item is only inserted once per key, and only the first completion of an item is stored.
+
+    Workers on several machines need the file on a filesystem with working `fcntl` locks. WAL mode (the default) additionally
+    requires all processes to run on the same host, use `journal_mode="DELETE"` for network filesystems.
+
+    Args:
+        path (Path | str): Location of the SQLite file.
+        lease_timeout (float, optional): Seconds a leased item may stay unfinished before it is handed to another worker. Defaults to 600.0.
+        max_attempts (int, optional): Leases of an item before it is marked as failed. Defaults to 3.
+        journal_mode (str, optional): SQLite journal mode. Defaults to "WAL".
+    """
+
+    def __init__(self, path: Path | str, *, lease_timeout: float = 600.0, max_attempts: int = 3, journal_mode: str = "WAL"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+
+        # One connection per queue object, shared by the worker threads and guarded by `_lock`; other processes are serialised by SQLite.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=60.0)
+        self._connection.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, grp TEXT NOT NULL, payload TEXT NOT NULL, "
+            "state TEXT NOT NULL DEFAULT 'pending', owner TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "result TEXT, error TEXT, updated REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_expires)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS items_grp ON items (grp)")
+
+    def publish(self, items: List[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """Inserts (key, group, payload) items, keys that are already queued are skipped. Returns the amount of new items."""
+        now = time.time()
+        rows = [(key, group, json.dumps(payload, ensure_ascii=False), now) for key, group, payload in items]
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._connection.total_changes
+                self._connection.executemany("INSERT OR IGNORE INTO items (key, grp, payload, updated) VALUES (?, ?, ?, ?)", rows)
+                inserted = self._connection.total_changes - before
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return inserted
+
+    def lease(self, owner: str, limit: int = 1) -> List[WorkItem]:
+        """Leases up to `limit` pending items, or leased ones whose lease has expired, to `owner`."""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so that two workers can never lease the same item.
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Items that keep killing their workers (e.g. out of memory) are given up like items that keep failing.
+                self._connection.execute(
+                    "UPDATE items SET state = 'failed', owner = NULL, error = COALESCE(error, 'lease expired ' || attempts || ' times'), "
+                    "updated = ? WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                rows = self._connection.execute(
+                    "SELECT id, key, grp, payload, attempts FROM items "
+                    "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) ORDER BY id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._connection.executemany(
+                    "UPDATE items SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                    [(owner, now + self.lease_timeout, now, row[0]) for row in rows],
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        return [WorkItem(id=row[0], key=row[1], group=row[2], payload=json.loads(row[3]), attempts=row[4] + 1) for row in rows]
+
+    def extend(self, item_ids: List[int], owner: str) -> None:
+        """Renews the leases of items that are still being worked on."""
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE items SET lease_expires = ?, updated = ? WHERE id = ? AND state = 'leased' AND owner = ?",
+                [(now + self.lease_timeout, now, item_id, owner) for item_id in item_ids],
+            )
+
+    def complete(self, item_id: int, owner: str, result: Dict[str, Any]) -> bool:
+        """Stores the result of an item. Returns False if it was already completed, e.g. by a worker whose lease had expired."""
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE items SET state = 'done', owner = ?, result = ?, error = NULL, updated = ? WHERE id = ? AND state != 'done'",
+                (owner, json.dumps(result, ensure_ascii=False), time.time(), item_id),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, item_id: int, owner: str, error: str) -> None:
+        """Hands the item back to the queue, or marks it as failed once it used up `max_attempts`."""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, owner = NULL, error = ?, updated = ? "
+                "WHERE id = ? AND state = 'leased' AND owner = ?",
+                (self.max_attempts, error, time.time(), item_id, owner),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        return {state: 0 for state in ITEM_STATES} | dict(rows)
+
+    def groups(self) -> Dict[str, Dict[str, int]]:
+        """Amount of items per state of every group."""
+        with self._lock:
+            rows = self._connection.execute("SELECT grp, state, COUNT(*) FROM items GROUP BY grp, state").fetchall()
+
+        groups: Dict[str, Dict[str, int]] = {}
+        for group, state, count in rows:
+            groups.setdefault(group, {state: 0 for state in ITEM_STATES})[state] = count
+        return groups
+
+    def results(self, group: str) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """(payload, result) of every completed item of `group`, in publishing order."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT payload, result FROM items WHERE grp = ? AND state = 'done' ORDER BY id", (group,)
+            ).fetchall()
+        return [(json.loads(payload), json.loads(result)) for payload, result in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class QueueWorker:
+    """Leases work items of a `WorkQueue`, queries the jury and the judge and stores the journal entry as the item's result.
+
+    Any number of workers can run on any number of machines, the results are merged into the run directories by `Pipeline.collect`.
+    Jury and judge instances are created per model on first use; a shared `cache` avoids repeating a jury call for several judges.
+
+    Args:
+        queue (WorkQueue): Queue to work on.
+        client_config (Optional[ClientConfig], optional): Endpoint(s) of the models. Defaults to the local ollama server.
+        max_concurrency (int, optional): Items in flight at once, which is also the concurrency of every model. Defaults to 8.
+        cache (Optional[ResponseCache], optional): Response cache of the models. Defaults to None.
+        reply_processing (Optional[Callable[[str], str]], optional): See `Pipeline`. Defaults to None.
+        worker_id (str, optional): Owner name of the leases. Defaults to "<hostname>-<pid>-<random>".
+        poll_interval (float, optional): Seconds to wait while the queue has no free item. Defaults to 1.0.
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        client_config: Optional[ClientConfig] = None,
+        max_concurrency: int = 8,
+        cache: Optional[ResponseCache] = None,
+        reply_processing: Optional[Callable[[str], str]] = None,
+        worker_id: str = "",
+        poll_interval: float = 1.0,
+    ):
+        self.queue = queue
+        self.client_config = client_config
+        self.max_concurrency = max(1, max_concurrency)
+        self.cache = cache
+        self.reply_processing = reply_processing
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_interval = poll_interval
+
+        # Keyed by model and its options (see `Pipeline.publish`), items of differently configured models never share an instance.
+        self._juries: Dict[Tuple[str, str], Jury] = {}
+        self._judges: Dict[Tuple[str, str], Judge] = {}
+        self._in_flight: Dict[int, WorkItem] = {}
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.max_concurrency)
+
+    def _jury(self, model: str, options: Dict[str, Any]) -> Jury:
+        key = (model, json.dumps(options, sort_keys=True))
+        if key not in self._juries:
+            self._juries[key] = Jury(
+                model=model, client_config=self.client_config, max_concurrency=self.max_concurrency, cache=self.cache, **options
+            )
+        return self._juries[key]
+
+    def _judge(self, model: str, options: Dict[str, Any]) -> Judge:
+        key = (model, json.dumps(options, sort_keys=True))
+        if key not in self._judges:
+            self._judges[key] = Judge(
+                model=model, client_config=self.client_config, max_concurrency=self.max_concurrency, cache=self.cache, **options
+            )
+        return self._judges[key]
+
+    def run(self, stop_when_empty: bool = True) -> int:
+        """Works on the queue until it holds no pending or leased items (or forever). Returns the amount of completed items."""
+        completed = 0
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(done,), name="QueueWorkerHeartbeat", daemon=True)
+        heartbeat.start()
+
+        def finish(future: Future, item: WorkItem) -> None:
+            nonlocal completed
+            try:
+                entry = future.result()
+            except Exception as error:
+                self.queue.fail(item.id, self.worker_id, f"{type(error).__name__}: {error}")
+                print(f"[worker] item {item.key} failed (attempt {item.attempts}): {error!r}")
+            else:
+                if self.queue.complete(item.id, self.worker_id, asdict(entry)):
+                    completed += 1
+            finally:
+                with self._lock:
+                    del self._in_flight[item.id]
+                self._slots.release()
+
+        try:
+            while True:
+                self._slots.acquire()
+                items = self.queue.lease(self.worker_id, limit=1)
+                if not items:
+                    self._slots.release()
+                    with self._lock:
+                        idle = not self._in_flight
+                    counts = self.queue.counts()
+                    if stop_when_empty and idle and counts["pending"] == 0 and counts["leased"] == 0:
+                        return completed
+                    time.sleep(self.poll_interval)
+                    continue
+
+                item = items[0]
+                with self._lock:
+                    self._in_flight[item.id] = item
+                future = self._process(item)
+                future.add_done_callback(lambda done_future, item=item: finish(done_future, item))
+        finally:
+            done.set()
+
+    def _process(self, item: WorkItem) -> Future:
+        payload = item.payload
+        result: Future = Future()
+        jury = self._jury(payload["jury"], payload["jury_options"])
+        jury_future = jury.submit(payload["question"], bypass_cache=payload["bypass_cache"], **payload["chat_params"])
+
+        def on_jury_reply(done: Future) -> None:
+            try:
+                jury_result: ChatResult = done.result()
+                jury_reply = self.reply_processing(jury_result.content) if self.reply_processing else jury_result.content
+                judge = self._judge(payload["judge"], payload["judge_options"])
+                judge_future = judge.submit(build_judge_message(payload["gold"], jury_reply), bypass_cache=payload["bypass_cache"])
+            except Exception as error:
+                result.set_exception(error)
+                return
+
+            def on_judge_reply(judge_done: Future) -> None:
+                try:
+                    judge_result: ChatResult = judge_done.result()
+                except Exception as error:
+                    result.set_exception(error)
+                    return
+                result.set_result(
+                    JournalEntry(
+                        dataset=payload["dataset"],
+                        qtype=payload["qtype"],
+                        position=payload["position"],
+                        jury=jury_result.content,
+                        judge=judge_result.content,
+                        jury_seconds=jury_result.seconds,
+                        judge_seconds=judge_result.seconds,
+                        judge_prompt_tokens=judge_result.prompt_tokens,
+                    )
+                )
+
+            judge_future.add_done_callback(on_judge_reply)
+
+        jury_future.add_done_callback(on_jury_reply)
+        return result
+
+    def _heartbeat(self, done: threading.Event) -> None:
+        # Renews the leases of slow requests well before they expire, so that no other worker picks them up meanwhile.
+        while not done.wait(self.queue.lease_timeout / 3):
+            with self._lock:
+                item_ids = list(self._in_flight)
+            if item_ids:
+                self.queue.extend(item_ids, self.worker_id)
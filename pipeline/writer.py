@@ -0,0 +1,56 @@
+import queue
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from utils import write_results
+
+
+class ResultWriter:
+    """Writes result files on a background thread, so that encoding and disk I/O never hold up the parsing of the next replies.
+
+    Frames are handed over through a bounded queue: once `max_pending` files are waiting, `submit` blocks until the disk has
+    caught up, which keeps the memory of a run bounded. Every file is written atomically (see `write_results`).
+
+    Args:
+        max_pending (int, optional): Files that may wait for the writer. Defaults to 8.
+        fsync (bool, optional): Flush every file to disk before the next one is written. Defaults to True.
+    """
+
+    def __init__(self, max_pending: int = 8, fsync: bool = True):
+        self.fsync = fsync
+        self._queue: queue.Queue[Optional[Tuple[pd.DataFrame, Path]]] = queue.Queue(maxsize=max(1, max_pending))
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="ResultWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, df: pd.DataFrame, path: Path) -> None:
+        # A failed write surfaces on the next submit instead of only at the end of a long run.
+        if self._error is not None:
+            raise self._error
+        self._queue.put((df, path))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                # Drained without writing, the run fails anyway.
+                continue
+
+            df, path = item
+            try:
+                write_results(df, path, fsync=self.fsync)
+            except BaseException as error:
+                self._error = error
+
+    def close(self) -> None:
+        """Waits until every submitted file is written, raising the first error of the writer."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
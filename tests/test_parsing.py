@@ -0,0 +1,66 @@
+import copy
+
+import numpy as np
+import pytest
+
+from court import Judge, Jury
+from pipeline import Pipeline
+from pipeline.parsing import build_judge_message
+from utils import ClientConfig, DataHolder, MessageTemplate
+
+ITERATIONS = 5
+JURY_REPLIES = ["Paris is the capital of France.", "Water boils at 100 degrees Celsius at sea level."]
+
+
+def prompt_tokens(content: str) -> int:
+    # Whitespace tokens, any tokenizer grows along with them if the prompt is wrapped again
+    return len(content.split())
+
+
+@pytest.fixture
+def dataholder() -> DataHolder:
+    return DataHolder(
+        questions=[{"role": "user", "content": "What is the capital of France?"}, {"role": "user", "content": "When does water boil?"}],
+        answers=[{"role": "user", "content": "The capital of France is Paris."}, {"role": "user", "content": "At 100 degrees Celsius."}],
+        qtype="facts",
+        total_entries=2,
+        dataset_name="test",
+        indices=np.array([3, 7]),
+    )
+
+
+@pytest.fixture
+def pipeline() -> Pipeline:
+    # No request is sent, the clients are only created
+    config = ClientConfig("http://127.0.0.1:9/v1", "test")
+    return Pipeline(
+        judge=Judge("judge", client_config=config), jury=Jury("jury", client_config=config), generator=None, metrics_format=None
+    )
+
+
+def test_judge_prompts_stay_constant_across_iterations(pipeline: Pipeline, dataholder: DataHolder):
+    answers = copy.deepcopy(dataholder.answers)
+
+    iterations = []
+    for _ in range(ITERATIONS):
+        # Every `query` builds the judge messages of the same DataHolder again, copied as they would be sent
+        messages = [pipeline._prepare_data_for_judge(reply, dataholder, index) for index, reply in enumerate(JURY_REPLIES)]
+        iterations.append(copy.deepcopy(messages))
+
+    first = iterations[0]
+    for messages in iterations[1:]:
+        assert messages == first
+        assert [prompt_tokens(message["content"]) for message in messages] == [prompt_tokens(message["content"]) for message in first]
+    assert dataholder.answers == answers
+
+
+def test_judge_message_is_a_new_message(dataholder: DataHolder):
+    template = copy.deepcopy(MessageTemplate)
+    gold = dataholder.answers[0]
+
+    message = build_judge_message(gold["content"], JURY_REPLIES[0])
+    message["content"] = "changed"
+
+    assert message is not gold
+    assert gold["content"] == "The capital of France is Paris."
+    assert MessageTemplate == template
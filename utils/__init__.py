@@ -1,10 +1,23 @@
 # from .startup import launch
-from .config import ClientConfig
+from .cache import ResponseCache
+from .config import ClientConfig, Endpoint
 from .constants import BASE_PATH as BASE_PATH
 from .constants import OLLAMA_START as OLLAMA_START
 from .constants import PID_FILE as PID_FILE
 from .generators import BalancedGenerator, DataHolder
 from .generators import Message as Message
 from .generators import MessageTemplate as MessageTemplate
+from .sources import CsvSource, DatasetSource, HuggingFaceSource
+from .results import RESULT_SCHEMA, RESULTS_PATH, find_result_files, load_results, write_results
 
-__all__ = ["launch, TestSetGenerator", "ClientConfig", "BalancedGenerator", "DataHolder"]
+__all__ = [
+    "launch, TestSetGenerator",
+    "ClientConfig",
+    "Endpoint",
+    "BalancedGenerator",
+    "DataHolder",
+    "ResponseCache",
+    "load_results",
+    "write_results",
+    "HuggingFaceSource",
+]
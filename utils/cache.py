@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .constants import CACHE_PATH
+
+
+class ResponseCache:
+    """Persistent, content-addressed cache for chat completions.
+
+    Entries are keyed by a hash of the model, the full message list and the chat parameters, so changing any of them
+    (e.g. the judge's system message) results in a cache miss for exactly the affected requests.
+
+    Args:
+        path (Path | str, optional): Location of the SQLite file. Defaults to `data/cache/responses.sqlite`.
+        max_entries (int, optional): Evict the least recently used entries above this amount. Defaults to None (unbounded).
+        max_bytes (int, optional): Evict the least recently used entries above this total content size. Defaults to None (unbounded).
+        max_age (float, optional): Entries older than `max_age` seconds are treated as missing. Defaults to None (never expire).
+    """
+
+    def __init__(
+        self,
+        path: Path | str = "",
+        *,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+    ):
+        self.path = Path(path) if path else CACHE_PATH / "responses.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.hits = 0
+        self.misses = 0
+
+        # A single connection shared by the worker threads of `BaseTemplate`, every access is guarded by `_lock`.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, content TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_model ON responses (model)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None or (self.max_age is not None and row[1] < now - self.max_age):
+                self.misses += 1
+                return None
+
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, model: str, content: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, len(content.encode("utf-8")), now, now),
+            )
+            self._evict()
+
+    def evict(self) -> int:
+        with self._lock:
+            return self._evict()
+
+    def _evict(self) -> int:
+        removed = 0
+
+        if self.max_age is not None:
+            removed += self._connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)).rowcount
+
+        if self.max_entries is not None:
+            removed += self._connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+
+        if self.max_bytes is not None:
+            # Keep the most recently accessed entries until their running size exceeds the budget.
+            removed += self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS running FROM responses) WHERE running > ?)",
+                (self.max_bytes,),
+            ).rowcount
+
+        return removed
+
+    def invalidate(self, model: Optional[str] = None) -> int:
+        """Removes all entries of `model`, or the entire cache if no model is given. Returns the amount of removed entries."""
+        with self._lock:
+            if model is None:
+                return self._connection.execute("DELETE FROM responses").rowcount
+
+            return self._connection.execute("DELETE FROM responses WHERE model = ?", (model,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
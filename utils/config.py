@@ -1,6 +1,32 @@
-from typing import NamedTuple
+from typing import NamedTuple, Optional, Tuple
+
+
+class Endpoint(NamedTuple):
+    base_url: str
+    # Falls back to the `api_key` of the `ClientConfig`
+    api_key: Optional[str] = None
+    # Relative share of the requests, e.g. 2.0 for a server with twice the GPUs
+    weight: float = 1.0
 
 
 class ClientConfig(NamedTuple):
     base_url: str
     api_key: str
+    # Connection pool of the shared HTTP client, see `court.clients.get_client`
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    timeout: float = 600.0
+    connect_timeout: float = 5.0
+    # Only used if the optional `h2` package is installed
+    http2: bool = True
+    # Per-endpoint rate limiting and retries, see `court.ratelimit.RateLimiter`
+    requests_per_second: Optional[float] = None
+    tokens_per_minute: Optional[int] = None
+    max_retries: int = 5
+    # Several servers of the same models, requests are routed per call, see `court.pool.EndpointPool`. Empty uses `base_url` only.
+    endpoints: Tuple[Endpoint, ...] = ()
+    # "least_outstanding" or "latency" (EWMA of the seconds per completion token, weighted by the requests in flight)
+    routing: str = "least_outstanding"
+    # Endpoints with this many consecutive connection errors / 5xx replies are drained until a health check succeeds again
+    max_failures: int = 3
+    health_check_interval: float = 10.0
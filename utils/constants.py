@@ -1,6 +1,7 @@
 from pathlib import Path
 
 BASE_PATH: Path = Path(__file__).parent.parent
+CACHE_PATH: Path = BASE_PATH / "data" / "cache"
 
 PID_FILE: Path = Path("/tmp/ollama_serve.pid")
 OLLAMA_START: list[str] = ["ollama", "serve"]
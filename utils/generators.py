@@ -1,11 +1,14 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple, TypedDict
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
 
 import numpy as np
 import pandas as pd
 
-from .constants import BASE_PATH
+from .constants import BASE_PATH, CACHE_PATH
+from .sources import CsvSource, DatasetSource
 
 
 class Message(TypedDict):
@@ -28,10 +31,18 @@ class DataHolder:
 
 class BalancedGenerator:
 
-    def __init__(self, csv_dir_path: Path | str = ""):
-        self.csv_dict: Dict[str, pd.DataFrame] = {}
-        self.csv_dir = csv_dir_path if csv_dir_path else Path(BASE_PATH, "data", "csv")
+    def __init__(self, csv_dir_path: Path | str = "", cache_dir: Path | str = "", datasets: Sequence[DatasetSource] = ()):
+        """
+        Args:
+            csv_dir_path (Path | str, optional): Directory that is searched for dataset csv files. Defaults to `data/csv`.
+            cache_dir (Path | str, optional): Where the binary copies and qtype indices of the datasets are cached. Defaults to `data/cache/datasets`.
+            datasets (Sequence[DatasetSource], optional): Additional datasets, e.g. `HuggingFaceSource`s. Defaults to ().
+        """
+        self.sources: Dict[str, DatasetSource] = {}
+        self.csv_dir = Path(csv_dir_path) if csv_dir_path else Path(BASE_PATH, "data", "csv")
+        self.cache_dir = Path(cache_dir) if cache_dir else CACHE_PATH / "datasets"
         self._load_csvs()
+        self.sources.update({source.name: source for source in datasets})
         self.data: List[DataHolder] = []
 
     def _load_csvs(self) -> bool:
@@ -41,9 +52,10 @@ class BalancedGenerator:
             print(f"No files were found within the {self.csv_dir.name} directory, aborting...")
             return False
 
+        # The files are converted into the binary cache once `generate_set` samples from them
         for csv in csv_files:
             dataset_name = csv.stem
-            self.csv_dict[dataset_name] = pd.read_csv(csv)
+            self.sources[dataset_name] = CsvSource(csv, cache_dir=self.cache_dir)
 
         return True
 
@@ -56,39 +68,52 @@ class BalancedGenerator:
             )
         return True
 
-    def generate_set(self, seed: int = 42, amount: int = 5) -> Dict[str, pd.DataFrame]:
-        np.random.seed(seed=seed)
-
-        for dataset_name, df in self.csv_dict.items():
-            unique_qtypes = df["qtype"].unique()
-
-            for qtype in unique_qtypes:
-                qtype_df = df[df["qtype"] == qtype].drop_duplicates(subset=["Question"])
-                qtype_indices = qtype_df.index.values.tolist()
-                qtype_len = len(qtype_df)
-
-                # Make sure that the input is amount <= df_len
-                self._validate_amount(amount=amount, qtype_len=qtype_len)
-
-                # Generate a np.ndarray[amount] with values ranging within the interval of [0, LAST_ROW] of the qtype
-                try:
-                    random_sequence = np.random.choice(qtype_indices, size=amount, replace=False)
-                except Exception:
-                    print(f"[ERROR] while trying to parse np.random.choice with {qtype_len=}")
-
-                chosen_rows = qtype_df.loc[random_sequence]
-                questions, answers = self._generate_questions_answers(chosen_rows)
-
-                self.data.append(
-                    DataHolder(
-                        qtype=qtype,
-                        dataset_name=dataset_name,
-                        questions=questions,
-                        answers=answers,
-                        total_entries=qtype_len,
-                        indices=random_sequence,
-                    )
+    def generate_set(self, seed: int = 42, amount: int = 5, workers: Optional[int] = None) -> List[DataHolder]:
+        # Every dataset is sampled independently (and in parallel), so the result doesn't depend on which one finishes first.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            sampled = executor.map(lambda item: self._sample_dataset(*item, seed=seed, amount=amount), self.sources.items())
+            for dataholders in sampled:
+                self.data.extend(dataholders)
+
+        return self.data
+
+    def _sample_dataset(self, dataset_name: str, source: DatasetSource, seed: int, amount: int) -> List[DataHolder]:
+        # Own random stream per dataset, derived from `seed` and the dataset name
+        rng = np.random.default_rng([seed, zlib.crc32(dataset_name.encode("utf-8"))])
+
+        chosen: Dict[str, Tuple[np.ndarray, int]] = {}
+        for qtype, qtype_indices in source.qtype_index().items():
+            qtype_len = len(qtype_indices)
+
+            # Make sure that the input is amount <= df_len
+            self._validate_amount(amount=amount, qtype_len=qtype_len)
+
+            # Generate a np.ndarray[amount] with values ranging within the interval of [0, LAST_ROW] of the qtype
+            chosen[qtype] = (rng.choice(qtype_indices, size=amount, replace=False), qtype_len)
+
+        if not chosen:
+            return []
+
+        # Only the Question / Answer columns of the sampled rows are read
+        rows = source.read_rows(np.concatenate([random_sequence for random_sequence, _ in chosen.values()]), columns=["Question", "Answer"])
+
+        dataholders = []
+        for qtype, (random_sequence, qtype_len) in chosen.items():
+            chosen_rows = rows.loc[random_sequence]
+            questions, answers = self._generate_questions_answers(chosen_rows)
+
+            dataholders.append(
+                DataHolder(
+                    qtype=qtype,
+                    dataset_name=dataset_name,
+                    questions=questions,
+                    answers=answers,
+                    total_entries=qtype_len,
+                    indices=random_sequence,
                 )
+            )
+
+        return dataholders
 
     def _generate_questions_answers(self, df: pd.DataFrame) -> Tuple[List[Message], List[Message]]:
         questions = []
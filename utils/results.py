@@ -0,0 +1,183 @@
+import os
+from pathlib import Path
+from typing import Collection, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .constants import BASE_PATH
+
+RESULTS_PATH: Path = BASE_PATH / "data" / "results"
+
+RESULT_SCHEMA = pa.schema(
+    [
+        pa.field("Position", pa.int64()),
+        pa.field("Answer", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("Score", pa.float64()),
+        pa.field("Reason", pa.string()),
+        pa.field("ParseError", pa.string()),
+        pa.field("Jury", pa.string()),
+        pa.field("JuryModel", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("JurySeconds", pa.float64()),
+        pa.field("JudgeSeconds", pa.float64()),
+        pa.field("JudgeInputTokens", pa.int64()),
+        pa.field("Similarity", pa.float64()),
+        pa.field("PreScored", pa.bool_()),
+        pa.field("Iteration", pa.int64()),
+    ]
+)
+
+# Results are laid out as `<judge>/<dataset>/<date>/run_<N>/<qtype>.parquet`, each level doubles as a partition. The juries of a
+# sweep get separate run numbers below the same judge, their rows are told apart by the `JuryModel` column.
+PARTITIONS: Tuple[str, ...] = ("judge", "dataset", "date", "run", "qtype")
+RESULT_FILETYPES: Tuple[str, ...] = ("parquet", "csv")
+
+Filters = Mapping[str, str | Collection[str]]
+
+
+def write_results(df: pd.DataFrame, path: Path, fsync: bool = True) -> Path:
+    """Writes the results of one qtype, `df` is indexed by `Position`. Columns missing in `df` are stored as nulls.
+
+    The file is written next to its destination and renamed into place, readers never see a truncated file. With `fsync`
+    the data and the rename are flushed to disk before returning, so a crash right after can't lose a finished qtype either.
+    """
+    frame = df.reset_index()
+    for field in RESULT_SCHEMA:
+        if field.name not in frame.columns:
+            frame[field.name] = None
+
+    table = pa.Table.from_pandas(frame[RESULT_SCHEMA.names], schema=RESULT_SCHEMA, preserve_index=False)
+    path = Path(path)
+    # Hidden and without the result suffix, so `find_result_files` never picks up a partial file.
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as file:
+            pq.write_table(table, file)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if fsync:
+        directory = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+    return path
+
+
+def _matches(value: str, allowed: str | Collection[str] | None) -> bool:
+    if allowed is None:
+        return True
+    if isinstance(allowed, str):
+        return value == allowed
+    return value in allowed
+
+
+def find_result_files(root: Optional[Path] = None, filters: Optional[Filters] = None) -> List[Tuple[Path, Dict[str, str]]]:
+    """Lists all result files below `root` together with their partition values, pruning them by `filters` without opening any file.
+
+    Args:
+        root (Optional[Path], optional): Results directory. Defaults to `data/results`.
+        filters (Optional[Filters], optional): Maps partition names (see `PARTITIONS`) to one or several allowed values. Defaults to None.
+
+    Returns:
+        List[Tuple[Path, Dict[str, str]]]: Result files, a parquet file shadows the legacy csv file of the same qtype.
+    """
+    root = Path(root) if root else RESULTS_PATH
+    filters = filters or {}
+
+    unknown = set(filters) - set(PARTITIONS)
+    if unknown:
+        raise KeyError(f"Unknown partitions {unknown}, expected any of {PARTITIONS}")
+
+    files: List[Tuple[Path, Dict[str, str]]] = []
+    for run_dir in sorted(root.glob("**/run_*/")):
+        date_dir = run_dir.parent
+        dataset_dir = date_dir.parent
+        # Judge models like 'org/model' span several directories, hence the judge is everything between `root` and the dataset.
+        partitions = {
+            "judge": dataset_dir.parent.relative_to(root).as_posix(),
+            "dataset": dataset_dir.name,
+            "date": date_dir.name,
+            "run": run_dir.name,
+        }
+        if not all(_matches(value, filters.get(name)) for name, value in partitions.items()):
+            continue
+
+        by_qtype: Dict[str, Path] = {}
+        for filetype in reversed(RESULT_FILETYPES):
+            for path in run_dir.glob(f"*.{filetype}"):
+                by_qtype[path.stem] = path
+
+        for qtype, path in sorted(by_qtype.items()):
+            if _matches(qtype, filters.get("qtype")):
+                files.append((path, {**partitions, "qtype": qtype}))
+
+    return files
+
+
+def read_result_file(path: Path, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        if not columns:
+            return pd.read_parquet(path)
+        # Files of older versions lack the columns that were added to the schema since, they are read as nulls.
+        available = set(pq.read_schema(path).names)
+        df = pd.read_parquet(path, columns=[column for column in columns if column in available])
+        for column in columns:
+            if column not in df.columns:
+                df[column] = None
+        return df[list(columns)]
+
+    # Legacy csv results only know a subset of the schema and are converted to its types.
+    available = pd.read_csv(path, nrows=0).columns
+    usecols = [column for column in columns if column in available] if columns else None
+    df = pd.read_csv(path, usecols=usecols)
+
+    for column in columns or RESULT_SCHEMA.names:
+        if column not in df.columns:
+            df[column] = None
+    if "Score" in df.columns:
+        df["Score"] = pd.to_numeric(df["Score"], errors="coerce")
+    if "Answer" in df.columns:
+        df["Answer"] = df["Answer"].astype("category")
+
+    return df[list(columns)] if columns else df
+
+
+def load_results(
+    root: Optional[Path] = None,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Filters] = None,
+    partitions: Sequence[str] = (),
+) -> pd.DataFrame:
+    """Reads all matching result files into one frame.
+
+    Args:
+        root (Optional[Path], optional): Results directory. Defaults to `data/results`.
+        columns (Optional[Sequence[str]], optional): Columns of `RESULT_SCHEMA` to read, all of them if None. Defaults to None.
+        filters (Optional[Filters], optional): Partition filters, see `find_result_files`. Defaults to None.
+        partitions (Sequence[str], optional): Partition values to attach as categorical columns, e.g. ("qtype", "run"). Defaults to ().
+
+    Returns:
+        pd.DataFrame: Concatenated results, empty if nothing matched.
+    """
+    frames = []
+    for path, values in find_result_files(root, filters):
+        df = read_result_file(path, columns)
+        for name in partitions:
+            df[name] = values[name]
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=list(columns or RESULT_SCHEMA.names) + list(partitions))
+
+    merged = pd.concat(frames, ignore_index=True)
+    for name in partitions:
+        merged[name] = merged[name].astype("category")
+    return merged
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from .constants import CACHE_PATH
+
+COLUMNS: List[str] = ["qtype", "Question", "Answer"]
+SCHEMA = pa.schema([pa.field(column, pa.string()) for column in COLUMNS])
+
+
+class DatasetSource(ABC):
+    """A dataset that is converted once into a memory-mapped Arrow (Feather v2) file within `cache_dir`.
+
+    Subclasses provide `fingerprint`, which invalidates the cache if it changes, and `_record_batches`, which streams
+    the `qtype`, `Question` and `Answer` columns of the source. Afterwards only the columns and rows that are actually
+    needed are read from the cache file.
+    """
+
+    def __init__(self, name: str, cache_dir: Path = CACHE_PATH / "datasets"):
+        self.name = name
+        self.cache_dir = Path(cache_dir)
+
+    @abstractmethod
+    def fingerprint(self) -> str: ...
+
+    @abstractmethod
+    def _record_batches(self) -> Iterator[pa.RecordBatch]: ...
+
+    def _cache_file(self, suffix: str) -> Path:
+        return self.cache_dir / f"{self.name}-{self.fingerprint()}.{suffix}"
+
+    def _drop_stale(self, suffix: str) -> None:
+        # Only files of this very dataset, "med" must not match the caches of "med-v2" that another thread may be reading.
+        own_file = re.compile(rf"{re.escape(self.name)}-[0-9a-f]{{16}}\.{re.escape(suffix)}")
+        current = self._cache_file(suffix)
+        for stale in self.cache_dir.glob(f"{self.name}-*.{suffix}"):
+            if stale != current and own_file.fullmatch(stale.name):
+                stale.unlink(missing_ok=True)
+
+    def arrow_path(self) -> Path:
+        arrow_file = self._cache_file("arrow")
+        if arrow_file.exists():
+            return arrow_file
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._drop_stale("arrow")
+
+        # Batches are written as they arrive, the source is never materialised in memory as a whole
+        tmp_file = arrow_file.with_suffix(".arrow.tmp")
+        with pa.OSFile(str(tmp_file), "wb") as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+            for batch in self._record_batches():
+                writer.write_batch(batch)
+        os.replace(tmp_file, arrow_file)
+
+        return arrow_file
+
+    def table(self) -> pa.Table:
+        # Memory-mapped and zero-copy, columns / rows are only paged in once they are accessed
+        return pa.ipc.open_file(pa.memory_map(str(self.arrow_path()), "r")).read_all()
+
+    def qtype_index(self) -> Dict[str, np.ndarray]:
+        """Returns the row numbers of the first occurrence of every question per qtype, qtypes in order of their first appearance."""
+        index_file = self._cache_file("index.npz")
+
+        if index_file.exists():
+            with np.load(index_file, allow_pickle=False) as cached:
+                return dict(zip(cached["qtypes"].tolist(), np.split(cached["rows"], cached["bounds"][1:-1])))
+
+        index = self._build_qtype_index()
+
+        # Drop indices of older versions of the dataset before storing the new one
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._drop_stale("index.npz")
+
+        rows = list(index.values())
+        np.savez(
+            index_file,
+            qtypes=np.array(list(index.keys()), dtype=str),
+            rows=np.concatenate(rows) if rows else np.array([], dtype=np.int64),
+            bounds=np.cumsum([0] + [len(group) for group in rows]),
+        )
+        return index
+
+    def _build_qtype_index(self) -> Dict[str, np.ndarray]:
+        df = self.table().select(["qtype", "Question"]).to_pandas()
+
+        # Same selection as `drop_duplicates(subset=["Question"])` within every qtype, computed for all qtypes in one go
+        unique_rows = np.flatnonzero(~df.duplicated(subset=["qtype", "Question"]).to_numpy())
+        qtypes = df["qtype"].to_numpy()[unique_rows]
+
+        groups = pd.Series(unique_rows, dtype=np.int64).groupby(qtypes, sort=False)
+        return {str(qtype): rows.to_numpy() for qtype, rows in groups}
+
+    def read_rows(self, rows: np.ndarray, columns: List[str]) -> pd.DataFrame:
+        """Reads only `columns` of the given row numbers, the result is indexed by the row number."""
+        df = self.table().select(columns).take(pa.array(rows, type=pa.int64())).to_pandas()
+        df.index = rows
+        return df
+
+
+class CsvSource(DatasetSource):
+    """A dataset csv file, cached under a key of its path, size and mtime, hence edits to the file invalidate the cache."""
+
+    def __init__(self, path: Path, cache_dir: Path = CACHE_PATH / "datasets", block_size: int = 16 << 20):
+        super().__init__(Path(path).stem, cache_dir)
+        self.path = Path(path)
+        self.block_size = block_size
+
+    def fingerprint(self) -> str:
+        stat = self.path.stat()
+        key = f"{self.path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def _record_batches(self) -> Iterator[pa.RecordBatch]:
+        reader = pa_csv.open_csv(
+            self.path,
+            read_options=pa_csv.ReadOptions(block_size=self.block_size),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=COLUMNS,
+                column_types={column: pa.string() for column in COLUMNS},
+                strings_can_be_null=True,
+            ),
+        )
+        for batch in reader:
+            yield batch.select(COLUMNS)
+
+
+class HuggingFaceSource(DatasetSource):
+    """A Hugging Face `datasets` dataset, streamed batch by batch into the cache without downloading it as a whole.
+
+    Args:
+        path (str): Dataset name on the hub, e.g. "lavita/MedQuAD".
+        split (str, optional): Defaults to "train".
+        config (Optional[str], optional): Dataset configuration. Defaults to None.
+        revision (Optional[str], optional): Git revision, pin it to keep the cache valid. Defaults to None.
+        columns (Optional[Mapping[str, str]], optional): Renames source columns to `qtype`, `Question` and `Answer`. Defaults to None.
+        name (Optional[str], optional): Dataset name used within the results. Defaults to the last part of `path`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        split: str = "train",
+        config: Optional[str] = None,
+        revision: Optional[str] = None,
+        columns: Optional[Mapping[str, str]] = None,
+        name: Optional[str] = None,
+        cache_dir: Path = CACHE_PATH / "datasets",
+        batch_size: int = 10_000,
+    ):
+        super().__init__(name or path.split("/")[-1], cache_dir)
+        self.path = path
+        self.split = split
+        self.config = config
+        self.revision = revision
+        self.columns = dict(columns or {})
+        self.batch_size = batch_size
+
+    def fingerprint(self) -> str:
+        key = f"{self.path}:{self.config}:{self.split}:{self.revision}:{sorted(self.columns.items())}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def _record_batches(self) -> Iterator[pa.RecordBatch]:
+        from datasets import load_dataset
+
+        dataset = load_dataset(self.path, name=self.config, split=self.split, revision=self.revision, streaming=True)
+        source_columns = {target: source for source, target in self.columns.items()}
+
+        for batch in dataset.iter(batch_size=self.batch_size):
+            arrays = [
+                pa.array([None if value is None else str(value) for value in batch[source_columns.get(column, column)]], pa.string())
+                for column in COLUMNS
+            ]
+            yield pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
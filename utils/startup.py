@@ -1,19 +1,19 @@
 import atexit
 import os
+import shutil
 import signal
-import socket
 import subprocess
 import sys
+import threading
 import time
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence
 
-from .constants import OLLAMA_START, PID_FILE
+import httpx
 
-"""TODO:
-    - While running the code in `DEBUG` mode and crashing due to an error, we instantiate an orphant process, which would be killed if we execute the code again normally.
-    - However, if we were to run the code in `DEBUG` mode again, another orphan ends up spawning, which makes any future execution impossible, as ollama cannot create a connection successfully.
-    - Thus, processing killing must be conducted more throughly in the future.
-"""
+from .config import ClientConfig, Endpoint
+from .constants import OLLAMA_START, PID_FILE
 
 
 def is_processing_running(pid: int) -> bool:
@@ -32,81 +32,283 @@ def is_processing_running(pid: int) -> bool:
     return True
 
 
-def start_ollama() -> subprocess.Popen | None:
-    global PID_FILE
+def _is_ollama(pid: int) -> bool:
+    cmdline = Path(f"/proc/{pid}/cmdline")
+    if not cmdline.parent.exists():
+        return is_processing_running(pid)
+    try:
+        return "ollama" in cmdline.read_bytes().decode(errors="replace")
+    except OSError:
+        return False
+
+
+def _node_cpus(node: int) -> List[int]:
+    """CPUs of a NUMA node, parsed from its sysfs cpulist like '0-7,16-23'."""
+    cpus: List[int] = []
+    for part in Path(f"/sys/devices/system/node/node{node}/cpulist").read_text().strip().split(","):
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+@dataclass
+class OllamaWorker:
+    """One `ollama serve` process of an `OllamaSupervisor`."""
+
+    host: str
+    port: int
+    env: Dict[str, str] = field(default_factory=dict)
+    cpus: Optional[Sequence[int]] = None
+    numa_node: Optional[int] = None
+    process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def pid_file(self) -> Path:
+        return Path(PID_FILE).with_name(f"{Path(PID_FILE).stem}_{self.port}.pid")
+
+
+class OllamaSupervisor:
+    """Starts, warms up and stops several `ollama serve` workers, each on its own port.
+
+    Workers are started in their own session and process group, which is terminated as a whole (including the model runners)
+    when the supervisor stops, the interpreter exits or receives SIGINT / SIGTERM. A worker left over by a killed run is found
+    through its PID file and is reused if it answers, otherwise its process group is killed before a new one is started.
+
+    Args:
+        workers (int, optional): Amount of `ollama serve` processes. Defaults to 1.
+        host (str, optional): Address the workers bind to. Defaults to "127.0.0.1".
+        base_port (int, optional): Port of the first worker, the others use the following ports. Defaults to 11434.
+        env (Optional[Mapping[str, str]], optional): Environment of every worker, e.g. {"OLLAMA_NUM_PARALLEL": "4"}. Defaults to None.
+        worker_env (Optional[Sequence[Mapping[str, str]]], optional): Additional environment per worker, e.g. its `CUDA_VISIBLE_DEVICES`. Defaults to None.
+        cpus (Optional[Sequence[Sequence[int]]], optional): CPUs each worker is pinned to with `taskset`. Defaults to None.
+        numa_nodes (Optional[Sequence[int]], optional): NUMA node of each worker, bound with `numactl` if available, otherwise only
+            pinned to the node's CPUs. Defaults to None.
+        models (Sequence[str], optional): Models loaded into every worker before `start` returns, e.g. the jury and judge models. Defaults to ().
+        keep_alive (str, optional): How long the warmed models stay loaded. Defaults to "1h".
+        reuse_running (bool, optional): Keep a worker of a previous run if it is still healthy instead of restarting it. Defaults to True.
+        ready_timeout (float, optional): Seconds a worker may take until its API answers. Defaults to 30.0.
+        load_timeout (float, optional): Seconds loading a model during `warmup` may take. Defaults to 600.0.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        host: str = "127.0.0.1",
+        base_port: int = 11434,
+        env: Optional[Mapping[str, str]] = None,
+        worker_env: Optional[Sequence[Mapping[str, str]]] = None,
+        cpus: Optional[Sequence[Sequence[int]]] = None,
+        numa_nodes: Optional[Sequence[int]] = None,
+        models: Sequence[str] = (),
+        keep_alive: str = "1h",
+        reuse_running: bool = True,
+        ready_timeout: float = 30.0,
+        load_timeout: float = 600.0,
+    ):
+        self.workers = [
+            OllamaWorker(
+                host=host,
+                port=base_port + index,
+                env={**(env or {}), **(worker_env[index] if worker_env and index < len(worker_env) else {})},
+                cpus=cpus[index] if cpus and index < len(cpus) else None,
+                numa_node=numa_nodes[index] if numa_nodes and index < len(numa_nodes) else None,
+            )
+            for index in range(max(1, workers))
+        ]
+        self.models = list(models)
+        self.keep_alive = keep_alive
+        self.reuse_running = reuse_running
+        self.ready_timeout = ready_timeout
+        self.load_timeout = load_timeout
+        self._stopped = False
+
+    def start(self) -> "OllamaSupervisor":
+        # Registered first, a worker failing to start must not leave the already started ones behind.
+        atexit.register(self.stop)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, _signal_handler)
+
+        for worker in self.workers:
+            self._start_worker(worker)
+
+        for worker in self.workers:
+            self._wait_until_ready(worker)
+        self.warmup()
+        return self
+
+    def _start_worker(self, worker: OllamaWorker) -> None:
+        if worker.pid_file.exists():
+            try:
+                pid = int(worker.pid_file.read_text())
+            except ValueError:
+                pid = None
+
+            if pid is not None and _is_ollama(pid) and self.reuse_running and self._is_ready(worker):
+                print(f"[ollama] worker on port {worker.port} is already running (PID: {pid}); reusing it")
+                return
+
+            # PIDs are recycled, hence only a group that still contains ollama processes is terminated.
+            if pid is not None and any(_is_ollama(member) for member in _group_members(pid)):
+                print(f"[ollama] terminating the leftovers of the worker on port {worker.port} (PGID: {pid})")
+                _terminate_group(pid)
+            worker.pid_file.unlink(missing_ok=True)
+
+        command = list(OLLAMA_START)
+        cpus = worker.cpus
+        if worker.numa_node is not None:
+            if shutil.which("numactl"):
+                command = ["numactl", f"--cpunodebind={worker.numa_node}", f"--membind={worker.numa_node}"] + command
+            else:
+                cpus = cpus or _node_cpus(worker.numa_node)
+        # Pinned by a wrapper rather than in the forked child, `preexec_fn` isn't safe in a threaded program. The affinity is
+        # inherited by every thread and model runner of the worker.
+        if cpus:
+            if shutil.which("taskset"):
+                command = ["taskset", "--cpu-list", ",".join(str(cpu) for cpu in cpus)] + command
+            else:
+                print(f"[ollama] 'taskset' is not available, the worker on port {worker.port} is not pinned to CPUs {list(cpus)}")
 
-    PID_FILE = Path(PID_FILE)
-    if PID_FILE.exists():
+        environment = {**os.environ, **worker.env, "OLLAMA_HOST": f"{worker.host}:{worker.port}"}
+        worker.process = subprocess.Popen(
+            command,
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
 
+        worker.pid_file.write_text(str(worker.process.pid))
+        print(f"[ollama] started worker on port {worker.port} under PID {worker.process.pid}")
+
+    def _is_ready(self, worker: OllamaWorker) -> bool:
         try:
-            current_pid = int(PID_FILE.read_text())
-            if is_processing_running(current_pid):
-                print(f"[ollama] is already running (PID: {current_pid}); skipping initialisation")
-                return None
-        except Exception:
-            pass
+            return httpx.get(f"{worker.url}/api/version", timeout=2.0).status_code == 200
+        except httpx.HTTPError:
+            return False
 
-    process = subprocess.Popen(
-        OLLAMA_START,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        start_new_session=True,
-    )
+    def _wait_until_ready(self, worker: OllamaWorker, interval: float = 0.1) -> None:
+        # An open port only means the listener exists, the API answering means requests are actually served.
+        deadline = time.monotonic() + self.ready_timeout
+        while not self._is_ready(worker):
+            if worker.process is not None and worker.process.poll() is not None:
+                raise RuntimeError(f"[ollama] worker on port {worker.port} exited with code {worker.process.returncode}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"[ollama] worker on port {worker.port} not ready after {self.ready_timeout}s")
+            time.sleep(interval)
 
-    PID_FILE.write_text(str(process.pid))
-    print(f"[ollama] started under PID {process.pid}")
+    def warmup(self, models: Optional[Sequence[str]] = None) -> None:
+        """Loads `models` into every worker at once, so that the first questions of a run don't pay for the cold start."""
+        models = list(models) if models is not None else self.models
+        errors: List[str] = []
 
-    return process
+        def load(worker: OllamaWorker, model: str) -> None:
+            # A request without a prompt only loads the model.
+            start = time.perf_counter()
+            try:
+                response = httpx.post(
+                    f"{worker.url}/api/generate", json={"model": model, "keep_alive": self.keep_alive}, timeout=self.load_timeout
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as error:
+                errors.append(f"'{model}' on port {worker.port}: {error!r}")
+                return
+            print(f"[ollama] loaded '{model}' on port {worker.port} in {time.perf_counter() - start:.1f}s")
 
+        threads = [threading.Thread(target=load, args=(worker, model)) for worker in self.workers for model in models]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
-def kill_ollama(process: subprocess.Popen | None):
-    if not process:
-        return
+        if errors:
+            raise RuntimeError(f"[ollama] warmup failed for {', '.join(errors)}")
+
+    def client_config(self, api_key: str = "ollama", **kwargs) -> ClientConfig:
+        """A `ClientConfig` routing across all workers, see `court.pool.EndpointPool`."""
+        endpoints = tuple(Endpoint(f"{worker.url}/v1/") for worker in self.workers)
+        return ClientConfig(base_url=endpoints[0].base_url, api_key=api_key, endpoints=endpoints, **kwargs)
+
+    def stop(self) -> None:
+        if self._stopped:
+            return
+        self._stopped = True
+
+        for worker in self.workers:
+            # Reused workers of a previous run are left running, only the ones started here are stopped.
+            if worker.process is None:
+                continue
+            _terminate_group(worker.process.pid, worker.process)
+            worker.pid_file.unlink(missing_ok=True)
+            print(f"[ollama] stopped worker on port {worker.port}")
+
+    def __enter__(self) -> "OllamaSupervisor":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
 
-    try:
-        pgid = os.getpgid(process.pid)
-        os.killpg(pgid, signal.SIGTERM)
-        print(f"[ollama] sent SIGTERM to PGID {pgid}")
-    except Exception as e:
-        print(f"[ollama] error terminating: {e!r}")
 
-    finally:
+def _group_members(pgid: int) -> List[int]:
+    """Live (non-zombie) processes of the process group `pgid`."""
+    proc = Path("/proc")
+    if not proc.exists():
         try:
-            PID_FILE.unlink()
-        except FileNotFoundError:
-            pass
+            os.killpg(pgid, 0)
+        except OSError:
+            return []
+        return [pgid]
 
+    members = []
+    for stat_file in proc.glob("[0-9]*/stat"):
+        try:
+            # The command name may contain spaces, the fields after its closing parenthesis are fixed: state, ppid, pgrp, ...
+            fields = stat_file.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[2]) == pgid and fields[0] != "Z":
+            members.append(int(stat_file.parent.name))
+    return members
 
-def _singal_handler(signal_number, frame):
-    sys.exit(0)
 
+def _terminate_group(pgid: int, process: Optional[subprocess.Popen] = None, timeout: float = 10.0) -> None:
+    """Sends SIGTERM to the process group `pgid`, escalates to SIGKILL after `timeout` and reaps `process`.
+
+    Workers are session leaders, hence their PID is the PGID. The group is terminated even if the worker itself is already
+    gone, its model runners may still be alive.
+    """
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+    except ProcessLookupError:
+        if process is not None:
+            process.wait()
+        return
 
-def _wait_for_port(
-    host: str = "localhost",
-    port: int = 11434,
-    timeout: float = 10.0,
-    interval: float = 0.1,
-):
     deadline = time.monotonic() + timeout
-    while True:
+    while time.monotonic() < deadline:
+        if process is not None:
+            process.poll()
+        if not _group_members(pgid):
+            break
+        time.sleep(0.1)
+    else:
+        print(f"[ollama] PGID {pgid} ignored SIGTERM, killing it")
         try:
-            with socket.create_connection(address=(host, port), timeout=1):
-                return
-        except OSError:
+            os.killpg(pgid, signal.SIGKILL)
+        except ProcessLookupError:
             pass
 
-        if time.monotonic() > deadline:
-            raise TimeoutError(f"Port {port} not open after {timeout}s")
+    if process is not None:
+        process.wait()
 
-        time.sleep(interval)
 
+def _signal_handler(signal_number, frame):
+    sys.exit(0)
 
-def launch():
-    ollama_process = start_ollama()
 
-    if ollama_process:
-        # Currently we are too fast until the Connection is fully established, hence we sleep to assure that it is connected
-        _wait_for_port()
-        atexit.register(lambda: kill_ollama(ollama_process))
-        for sig in (signal.SIGINT, signal.SIGTERM):
-            signal.signal(sig, _singal_handler)
+def launch(workers: int = 1, models: Sequence[str] = (), **kwargs) -> OllamaSupervisor:
+    """Starts (or reuses) the local ollama workers and loads `models`, see `OllamaSupervisor` for the remaining arguments."""
+    return OllamaSupervisor(workers=workers, models=models, **kwargs).start()